@@ -1,403 +1,520 @@
-from flask import Flask, render_template_string, request, jsonify
+import sys
+
+# gevent has to patch the standard library before anything creates a lock or a thread
+if __name__ == '__main__' and '--gevent' in sys.argv[1:]:
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        pass
+
+from flask import Flask, g, request, jsonify
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+import argparse
+import io
+import json
 import os
 import platform
 
-app = Flask(__name__)
+from assets import COMPRESS_MIN_SIZE, compress, gzip_stream, load_assets, negotiate_encoding
+from bulk import (
+    FORMAT_MIMETYPES,
+    IMPORT_FORMATS,
+    BulkImportError,
+    guess_format,
+    read_records,
+    spool_hosts,
+    spooled_hosts,
+    spooled_rows_error,
+    stream_hosts_csv,
+)
+from events import publish_change, release_stream, reserve_stream, set_stream_limit, stream_events
+from history import HISTORY_ENABLED, diff_versions, latest_version_id, list_versions, record_save, version_content
+from includes import add_watch_listener, expand_config, start_watcher, watch_config
+from lint import LintError, config_home, lint_config, lint_pre_save
+from metrics import ENDPOINT_KEY, PROMETHEUS_MIMETYPE, count_cache, instrument, render_metrics, timed
+from resolver import compile_matcher, resolve_host
+from sshconfig import (
+    apply_config_patch,
+    generate_ssh_config,
+    iter_hosts,
+    merge_ssh_config,
+    parse_ssh_config_incremental,
+    serialize_config,
+    upsert_ssh_config,
+)
+from store import (
+    TENANT_PATH_TEMPLATE,
+    add_post_write_hook,
+    add_pre_save_hook,
+    config_stat_key,
+    config_transaction,
+    current_config_entry,
+    fill_config_cache,
+    finish_config_write,
+    get_cache_metrics,
+    get_tenant,
+    get_writer_metrics,
+    load_config_cached,
+    peek_config_cache,
+    queue_config_write,
+)
 
-# Windows and Unix path compatibility
-if platform.system() == 'Windows':
-    SSH_CONFIG_PATH = os.path.expanduser("~\\.ssh\\config")
-else:
-    SSH_CONFIG_PATH = os.path.expanduser("~/.ssh/config")
+# Static files are served from memory by static_asset(), under content-hashed names
+app = Flask(__name__, static_folder=None)
+app.wsgi_app = instrument(app.wsgi_app)
+ASSETS = load_assets()
 
-def parse_ssh_config(content):
-    """Parse SSH config file into a list"""
-    hosts = []
-    current_host = None
-    
-    for line in content.split('\n'):
-        line = line.strip()
-        if not line or line.startswith('#'):
-            continue
-        
-        parts = line.split(None, 1)
-        if not parts:
-            continue
-        
-        key = parts[0].lower()
-        value = parts[1] if len(parts) > 1 else ""
-        
-        if key == 'host':
-            if current_host:
-                hosts.append(current_host)
-            current_host = {'name': value, 'options': {}}
-        elif current_host:
-            current_host['options'][key] = value
+# Hashed asset URLs never change content, so browsers may keep them for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Request header (or ?tenant= parameter) naming the tenant whose config a request works on
+TENANT_HEADER = 'X-SSH-Config-Tenant'
+# Header in which a trusted authenticating proxy passes the user name; unset uses the WSGI REMOTE_USER
+USER_HEADER = os.environ.get('SSH_CONFIG_USER_HEADER')
+
+# Seconds between background checks of the config and its Include files (0 disables)
+WATCH_INTERVAL = float(os.environ.get('SSH_CONFIG_WATCH_INTERVAL', '2'))
+
+# Host listing page sizes and the per-index search result cache size
+HOSTS_PAGE_DEFAULT = 100
+HOSTS_PAGE_MAX = 1000
+SEARCH_CACHE_SIZE = 64
+
+# Most hostnames one POST /api/resolve may ask for
+RESOLVE_BATCH_MAX = 1000
+
+# Lint issues returned by /api/lint unless ?limit= asks for more
+LINT_ISSUES_MAX = 1000
+
+# History versions listed per page
+HISTORY_PAGE_DEFAULT = 100
+HISTORY_PAGE_MAX = 1000
+
+# Configs at least this many bytes are streamed from disk on a cache miss instead of parsed whole
+CONFIG_STREAM_THRESHOLD = int(os.environ.get('SSH_CONFIG_STREAM_THRESHOLD', str(4 * 1024 * 1024)))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def stream_hosts_body(hosts, fmt):
+    """Yield Host records as a {"hosts": [...]} document or as NDJSON, in chunks of about STREAM_CHUNK_SIZE"""
+    chunk = ['{"hosts":['] if fmt == 'json' else []
+    size = 0
+    separator = ''
+    for host in hosts:
+        line = json.dumps(host.to_dict(), separators=(',', ':'))
+        if fmt == 'json':
+            chunk.append(separator)
+            separator = ','
+        else:
+            line += '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if fmt == 'json':
+        chunk.append(']}')
+    yield ''.join(chunk)
+
+def stream_config_file(f, fmt):
+    """Stream the hosts of an open config file, closing it when the response ends"""
+    with f:
+        yield from stream_hosts_body(iter_hosts(f), fmt)
+
+def stream_export(hosts, fmt):
+    """Yield hosts in an export format"""
+    return stream_hosts_csv(hosts) if fmt == 'csv' else stream_hosts_body(hosts, fmt)
+
+def import_hosts(tenant, stream, fmt, replace=False, check_version=None):
+    """Upsert the hosts read from a text stream into a tenant's config with one atomic write
+
+    Returns (entry, counts), or (error response, None) when check_version
+    rejects the current entry. The input is read and validated before the
+    config is locked, so a slow upload does not hold up other saves. Nothing
+    is written if any row is invalid or would add lint errors; both raise
+    BulkImportError naming the rows.
+    """
+    with spool_hosts(read_records(stream, fmt)) as spool:
+        with config_transaction(tenant):
+            entry = current_config_entry(tenant)
+            error = check_version(entry) if check_version else None
+            if error:
+                return error, None
+            content, counts = upsert_ssh_config(entry['parsed'], spooled_hosts(spool), replace)
+            if not counts['added'] and not counts['updated']:
+                return entry, counts
+            try:
+                ticket = queue_config_write(tenant, content, entry, source='import')
+            except LintError as e:
+                raise spooled_rows_error(spool, e.issues) from None
+    return finish_config_write(ticket), counts
+
+def check_config_version(entry, data, required=False):
+    """Return an error response if the client's version token (If-Match or 'version') is stale"""
+    if request.if_match:
+        current = request.if_match.contains(entry['etag'])
+    elif data.get('version') is not None:
+        current = data['version'] == entry['etag']
+    elif required:
+        return jsonify({'success': False, 'error': 'A version token is required', 'version': entry['etag']}), 428
+    else:
+        current = True
+    if not current:
+        return jsonify({'success': False, 'error': 'Configuration was changed by someone else', 'version': entry['etag']}), 412
+    return None
+
+def host_search_terms(host):
+    """Lowercased alias, HostName and User values a host can be searched by"""
+    terms = host.name.lower().split()
+    for key in ('hostname', 'user'):
+        value = host.get(key)
+        if value:
+            terms.append(value.lower())
+    return terms
+
+def build_host_index(hosts):
+    """Build a sorted term list for prefix search and trigram postings for substring search"""
+    terms = []
+    trigrams = {}
+    for pos, host in enumerate(hosts):
+        grams = set()
+        for term in host_search_terms(host):
+            terms.append((term, pos))
+            grams.update(term[i:i + 3] for i in range(len(term) - 2))
+        for gram in grams:
+            postings = trigrams.get(gram)
+            if postings is None:
+                postings = trigrams[gram] = array('I')
+            postings.append(pos)
+    terms.sort()
+    return {'terms': terms, 'trigrams': trigrams, 'results': {}}
+
+def search_host_index(index, hosts, query, match='substring'):
+    """Return the sorted positions of hosts matching query
+
+    Substring search needs at least three characters to use the trigram
+    postings; shorter queries fall back to a prefix search.
+    """
+    query = query.lower()
+    if len(query) < 3:
+        match = 'prefix'
+    cache_key = (query, match)
+    results = index['results'].get(cache_key)
+    if results is not None:
+        return results
     
-    if current_host:
-        hosts.append(current_host)
+    if match == 'prefix':
+        terms = index['terms']
+        matches = set()
+        i = bisect_left(terms, (query,))
+        while i < len(terms) and terms[i][0].startswith(query):
+            matches.add(terms[i][1])
+            i += 1
+        results = sorted(matches)
+    else:
+        postings = []
+        for gram in {query[i:i + 3] for i in range(len(query) - 2)}:
+            if gram not in index['trigrams']:
+                postings = None
+                break
+            postings.append(index['trigrams'][gram])
+        results = []
+        if postings:
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for other in postings[1:]:
+                candidates.intersection_update(other)
+            # Trigrams can match across non-adjacent positions, so confirm each candidate
+            results = [pos for pos in sorted(candidates)
+                       if any(query in term for term in host_search_terms(hosts[pos]))]
     
-    return hosts
+    if len(index['results']) >= SEARCH_CACHE_SIZE:
+        index['results'].clear()
+    index['results'][cache_key] = results
+    return results
 
-def generate_ssh_config(hosts):
-    """Convert host list to SSH config format"""
-    lines = []
-    for host in hosts:
-        lines.append(f"Host {host['name']}")
-        for key, value in host['options'].items():
-            lines.append(f"    {key} {value}")
-        lines.append("")
-    return '\n'.join(lines)
+def get_host_index(entry):
+    """Return the search index for a cache entry, building it on first use"""
+    index = entry.get('index')
+    if index is None:
+        index = entry['index'] = build_host_index(entry['hosts'])
+    return index
+
+def get_config_body(entry):
+    """Return the {"hosts": [...]} JSON of a cache entry, building it on first use"""
+    if 'body' not in entry:
+        with timed('json'):
+            entry['body'] = json.dumps({'hosts': [host.to_dict() for host in entry['hosts']]}, separators=(',', ':'))
+    return entry
+
+def get_host_matcher(tenant):
+    """Return the compiled Host matcher for a tenant's current Include-expanded config"""
+    expansion = expand_config(tenant['path'], config_home(tenant['path']), load_config_cached(tenant))
+    matcher = expansion.get('matcher')
+    if matcher is None:
+        matcher = expansion['matcher'] = compile_matcher(expansion['sections'])
+    return matcher
+
+def asset_response(asset, immutable):
+    """Serve a static asset in the best encoding the client accepts"""
+    encoding = negotiate_encoding(request.accept_encodings, asset['bodies'])
+    response = app.response_class(asset['bodies'][encoding], mimetype=asset['mimetype'])
+    response.vary.add('Accept-Encoding')
+    if encoding != 'identity':
+        response.content_encoding = encoding
+    # Each encoding is a different byte sequence, so it gets its own strong ETag
+    response.set_etag(asset['etag'] if encoding == 'identity' else f"{asset['etag']}-{encoding}")
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def encoded_body(holder, encoding):
+    """Return holder['body'] in an encoding, caching each encoding on the holder"""
+    body = holder['body']
+    if encoding == 'identity' or len(body) < COMPRESS_MIN_SIZE:
+        return body, 'identity'
+    encoded = holder.setdefault('encoded', {})
+    if encoding not in encoded:
+        encoded[encoding] = compress(body.encode('utf-8', 'surrogateescape'), encoding)
+    return encoded[encoding], encoding
+
+def stream_response(chunks, mimetype):
+    """Streaming response, gzipped on the fly when the client accepts it"""
+    gzipped = negotiate_encoding(request.accept_encodings, ('gzip',)) == 'gzip'
+    response = app.response_class(gzip_stream(chunks) if gzipped else chunks, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    if gzipped:
+        response.content_encoding = 'gzip'
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON responses for clients that accept it, unless the route already encoded them"""
+    if (response.status_code != 200 or response.is_streamed or response.content_encoding
+            or response.mimetype != 'application/json'):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    data = response.get_data()
+    if encoding != 'identity' and len(data) >= COMPRESS_MIN_SIZE:
+        response.set_data(compress(data, encoding))
+        response.content_encoding = encoding
+    return response
+
+@app.before_request
+def label_request():
+    # Requests are counted and timed per endpoint by the metrics middleware
+    request.environ[ENDPOINT_KEY] = request.endpoint
+
+def request_user():
+    """Return the authenticated user of the request, as the server or proxy in front of the app reports it"""
+    if USER_HEADER:
+        return request.headers.get(USER_HEADER) or None
+    return request.environ.get('REMOTE_USER') or None
+
+@app.before_request
+def select_tenant():
+    name = request.headers.get(TENANT_HEADER) or request.args.get('tenant', '')
+    user = request_user() if TENANT_PATH_TEMPLATE else None
+    if user is not None:
+        # An authenticated user works on their own config and no one else's
+        if name and name != user:
+            return jsonify({'error': f'{user!r} may not use tenant {name!r}'}), 403
+        name = user
+    elif name:
+        # The tenant name alone is not proof of who is asking
+        return jsonify({'error': 'Named tenants need an authenticated user'}), 403
+    try:
+        g.tenant = get_tenant(name)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+
+add_watch_listener(publish_change)
+add_pre_save_hook(lint_pre_save)
+if HISTORY_ENABLED:
+    add_post_write_hook(record_save)
+
+@app.before_request
+def start_config_watcher():
+    # Started from the first request so that each serving process runs its own
+    if WATCH_INTERVAL > 0:
+        tenant = g.tenant
+        watch_config(tenant['path'], config_home(tenant['path']), lambda: load_config_cached(tenant))
+        start_watcher(WATCH_INTERVAL)
 
 @app.route('/')
 def index():
-    html = '''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <title>SSH-Config-Editor-Flask</title>
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body { font-family: 'Roboto', -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif; background: #fafafa; min-height: 100vh; padding: 24px; }
-        .container { max-width: 1000px; margin: 0 auto; background: white; border-radius: 12px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); overflow: hidden; }
-        .header { background: white; padding: 24px; border-bottom: 1px solid #e0e0e0; border-radius: 12px 12px 0 0; }
-        .header h1 { font-size: 24px; font-weight: 500; color: #212121; margin-bottom: 4px; letter-spacing: -0.5px; }
-        .header p { color: #757575; font-size: 14px; font-weight: 400; }
-        .content { padding: 24px; }
-        .button-group { display: flex; gap: 12px; margin-bottom: 24px; flex-wrap: wrap; }
-        button { padding: 10px 16px; border: none; cursor: pointer; font-size: 14px; font-weight: 500; text-transform: uppercase; letter-spacing: 0.5px; transition: all 0.2s cubic-bezier(0.4, 0, 0.2, 1); font-family: 'Roboto', sans-serif; }
-        button:not(.tab-button) { border-radius: 6px; }
-        .btn-primary { background: white; color: #1976d2; border: 1px solid #bdbdbd; }
-        .btn-primary:hover { background: #f5f5f5; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-        .btn-success { background: #4caf50; color: white; }
-        .btn-success:hover { background: #45a049; box-shadow: 0 2px 8px rgba(76, 175, 80, 0.3); }
-        .btn-danger { background: white; color: #f44336; border: 1px solid #bdbdbd; }
-        .btn-danger:hover { background: #ffebee; border-color: #f44336; }
-        .btn-small { padding: 6px 12px; font-size: 12px; }
-        .host-card { background: white; border: 1px solid #e0e0e0; border-radius: 8px; padding: 16px; margin-bottom: 12px; transition: all 0.2s cubic-bezier(0.4, 0, 0.2, 1); cursor: grab; user-select: none; }
-        .host-card:hover { box-shadow: 0 2px 8px rgba(0,0,0,0.12), 0 2px 4px rgba(0,0,0,0.08); border-color: #bdbdbd; }
-        .host-card.dragging { opacity: 0.5; background: #f5f5f5; }
-        .host-card.drag-over { box-shadow: 0 4px 16px rgba(25, 118, 210, 0.2); border-color: #1976d2; border-width: 2px; }
-        .drag-handle { display: inline-block; color: #9e9e9e; margin-right: 8px; cursor: grab; font-size: 16px; }
-        .host-name { font-size: 16px; font-weight: 500; color: #212121; margin-bottom: 12px; display: flex; justify-content: space-between; align-items: center; }
-        .host-options { display: grid; gap: 12px; margin-bottom: 12px; }
-        .option-row { display: grid; grid-template-columns: 1fr 2fr auto; gap: 12px; align-items: center; }
-        .add-option-section { display: grid; grid-template-columns: 1fr 1fr auto; gap: 12px; align-items: center; padding-top: 12px; border-top: 1px solid #e0e0e0; }
-        .add-option-section select, .add-option-section input, .option-row input { padding: 8px 12px; border: 1px solid #bdbdbd; border-radius: 6px; font-size: 13px; font-family: 'Roboto', sans-serif; }
-        .add-option-section select:focus, .add-option-section input:focus, .option-row input:focus { outline: none; border-color: #1976d2; box-shadow: 0 0 0 2px rgba(25, 118, 210, 0.1); }
-        .option-row input:disabled { background: #fafafa; color: #9e9e9e; cursor: not-allowed; }
-        .modal { display: none; position: fixed; top: 0; left: 0; right: 0; bottom: 0; background: rgba(0,0,0,0.32); z-index: 1000; align-items: center; justify-content: center; }
-        .modal.active { display: flex; }
-        .modal-content { background: white; padding: 24px; border-radius: 12px; max-width: 500px; width: 90%; box-shadow: 0 5px 25px -8px rgba(0,0,0,0.3); }
-        .modal-content h2 { margin-bottom: 16px; color: #212121; font-size: 20px; font-weight: 500; }
-        .form-group { margin-bottom: 16px; }
-        .form-group label { display: block; margin-bottom: 8px; color: #212121; font-size: 13px; font-weight: 500; }
-        .form-group input { width: 100%; padding: 10px 12px; border: 1px solid #bdbdbd; border-radius: 6px; font-size: 14px; font-family: 'Roboto', sans-serif; }
-        .modal-buttons { display: flex; gap: 8px; margin-top: 24px; justify-content: flex-end; }
-        .message { padding: 12px 16px; border-radius: 2px; margin-bottom: 16px; display: none; font-size: 14px; }
-        .message.show { display: block; }
-        .message.success { background: #e8f5e9; color: #1b5e20; border-left: 4px solid #4caf50; }
-        .message.error { background: #ffebee; color: #b71c1c; border-left: 4px solid #f44336; }
-        .tabs-wrapper { border-bottom: 1px solid #e0e0e0; margin-bottom: 24px; }
-        .tabs { display: flex; gap: 0; }
-        .tab-button { padding: 16px 24px; border: none; background: transparent; color: #757575; cursor: pointer; border-bottom: 2px solid transparent; font-size: 14px; font-weight: 500; text-transform: uppercase; letter-spacing: 0.5px; transition: all 0.2s cubic-bezier(0.4, 0, 0.2, 1); }
-        .tab-button:hover { color: #212121; }
-        .tab-button.active { color: #1976d2; border-bottom-color: #1976d2; }
-        .tab-content { display: none; }
-        .tab-content.active { display: block; }
-        .raw-editor { background: #263238; color: #aed581; padding: 16px; border-radius: 8px; font-family: 'Roboto Mono', monospace; font-size: 12px; line-height: 1.6; border: 1px solid #37474f; min-height: 400px; width: 100%; resize: vertical; box-sizing: border-box; }
-        .raw-editor:focus { outline: none; box-shadow: 0 0 0 2px rgba(25, 118, 210, 0.1); }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>SSH-Config-Editor-Flask</h1>
-        </div>
-        
-        <div class="content">
-            <div class="message" id="message"></div>
-            
-            <div class="tabs-wrapper">
-                <div class="tabs">
-                    <button class="tab-button active" onclick="switchTab(event, 'editor')">Editor</button>
-                    <button class="tab-button" onclick="switchTab(event, 'raw')">Raw File</button>
-                </div>
-            </div>
-            
-            <div class="button-group">
-                <button class="btn-success" onclick="saveConfig()">Save</button>
-                <button class="btn-primary" onclick="loadConfig()">Refresh</button>
-                <button class="btn-primary" onclick="showAddHostModal()">Add Host</button>
-            </div>
-            
-            <div id="editor-content" class="tab-content active">
-                <div class="hosts-list" id="hostsList"></div>
-            </div>
-            
-            <div id="raw-content" class="tab-content">
-                <textarea class="raw-editor" id="rawEditor" placeholder="Paste or edit SSH config file content..."></textarea>
-                <div style="margin-top: 12px; display: flex; gap: 8px;">
-                    <button class="btn-success" onclick="saveRawConfig()">Save Raw File</button>
-                    <button class="btn-primary" onclick="loadRawConfig()">Load from File</button>
-                </div>
-            </div>
-        </div>
-    </div>
-    
-    <div class="modal" id="addHostModal">
-        <div class="modal-content">
-            <h2>Add New Host</h2>
-            <div class="form-group">
-                <label>Host Name/Alias *</label>
-                <input type="text" id="newHostName" placeholder="e.g.: myserver">
-            </div>
-            <div class="form-group">
-                <label>HostName</label>
-                <input type="text" id="newHostHostname" placeholder="e.g.: 192.168.1.100 or example.com">
-            </div>
-            <div class="form-group">
-                <label>User</label>
-                <input type="text" id="newHostUser" placeholder="e.g.: ubuntu">
-            </div>
-            <div class="form-group">
-                <label>Port</label>
-                <input type="text" id="newHostPort" placeholder="Default: 22">
-            </div>
-            <div class="form-group">
-                <label>IdentityFile</label>
-                <input type="text" id="newHostIdentity" placeholder="e.g.: ~/.ssh/id_rsa">
-            </div>
-            <div class="modal-buttons">
-                <button class="btn-primary" onclick="closeAddHostModal()">Cancel</button>
-                <button class="btn-success" onclick="addHost()">Add</button>
-            </div>
-        </div>
-    </div>
-    
-    <script>
-        let hosts = [];
-        let draggedIndex = null;
-        
-        function loadConfig() {
-            fetch('/api/config').then(r => r.json()).then(data => {
-                hosts = data.hosts;
-                renderHosts();
-                showMessage('Configuration loaded', 'success');
-            }).catch(err => showMessage('Load failed: ' + err, 'error'));
-        }
-        
-        function renderHosts() {
-            const listEl = document.getElementById('hostsList');
-            if (hosts.length === 0) {
-                listEl.innerHTML = '<p style="color: #a0aec0; text-align: center; padding: 40px;">No hosts configured yet</p>';
-                return;
-            }
-            
-            listEl.innerHTML = hosts.map((host, idx) => {
-                const optionsHtml = Object.entries(host.options).map(([key, value]) => `
-                    <div class="option-row">
-                        <input type="text" value="${key}" disabled style="background: #fafafa;">
-                        <input type="text" value="${value}" onchange="updateOption(${idx}, '${key}', this.value)">
-                        <button class="btn-danger btn-small" onclick="deleteOption(${idx}, '${key}')">Delete</button>
-                    </div>
-                `).join('');
-                
-                return `
-                    <div class="host-card" draggable="true" data-index="${idx}" ondragstart="dragStart(event)" ondragend="dragEnd(event)" ondragover="dragOver(event)" ondrop="drop(event)">
-                        <div class="host-name">
-                            <span><span class="drag-handle">⋮⋮</span>${host.name}</span>
-                            <button class="btn-danger btn-small" onclick="deleteHost(${idx})">Delete</button>
-                        </div>
-                        <div class="host-options">${optionsHtml}</div>
-                        <div class="add-option-section">
-                            <select id="optionSelect_${idx}" onchange="onOptionSelectChange(${idx})">
-                                <option value="">Add...</option>
-                                <option value="HostName">HostName</option>
-                                <option value="User">User</option>
-                                <option value="Port">Port</option>
-                                <option value="IdentityFile">IdentityFile</option>
-                                <option value="ProxyCommand">ProxyCommand</option>
-                                <option value="ProxyJump">ProxyJump</option>
-                                <option value="LocalForward">LocalForward</option>
-                                <option value="RemoteForward">RemoteForward</option>
-                                <option value="custom">Custom...</option>
-                            </select>
-                            <input type="text" id="optionValue_${idx}" placeholder="Enter value" onkeypress="if(event.key==='Enter') addOption(${idx})"></input>
-                            <button class="btn-success btn-small" onclick="addOption(${idx})">Add</button>
-                        </div>
-                    </div>
-                `;
-            }).join('');
-        }
-        
-        function updateOption(idx, key, value) { hosts[idx].options[key] = value; }
-        function deleteHost(idx) { if (confirm('Are you sure you want to delete?')) { hosts.splice(idx, 1); renderHosts(); } }
-        function deleteOption(idx, key) { delete hosts[idx].options[key]; renderHosts(); }
-        
-        function onOptionSelectChange(idx) {
-            const selectEl = document.getElementById(`optionSelect_${idx}`);
-            if (selectEl.value === 'custom') {
-                const customKey = prompt('Enter custom option name:');
-                if (customKey) {
-                    selectEl.value = customKey;
-                    document.getElementById(`optionValue_${idx}`).focus();
-                } else {
-                    selectEl.value = '';
-                }
-            }
-        }
-        
-        function addOption(idx) {
-            const selectEl = document.getElementById(`optionSelect_${idx}`);
-            const valueEl = document.getElementById(`optionValue_${idx}`);
-            let key = selectEl.value;
-            const value = valueEl.value.trim();
-            
-            if (!key || !value) {
-                showMessage('Please select an option and enter a value', 'error');
-                return;
-            }
-            
-            hosts[idx].options[key] = value;
-            selectEl.value = '';
-            valueEl.value = '';
-            renderHosts();
-            showMessage('Option added', 'success');
-        }
-        
-        function showAddHostModal() { document.getElementById('addHostModal').classList.add('active'); }
-        function closeAddHostModal() {
-            document.getElementById('addHostModal').classList.remove('active');
-            document.getElementById('newHostName').value = '';
-            document.getElementById('newHostHostname').value = '';
-            document.getElementById('newHostUser').value = '';
-            document.getElementById('newHostPort').value = '';
-            document.getElementById('newHostIdentity').value = '';
-        }
-        
-        function addHost() {
-            const name = document.getElementById('newHostName').value.trim();
-            if (!name) { showMessage('Please enter a host name', 'error'); return; }
-            
-            const options = {};
-            const hostname = document.getElementById('newHostHostname').value.trim();
-            const user = document.getElementById('newHostUser').value.trim();
-            const port = document.getElementById('newHostPort').value.trim();
-            const identity = document.getElementById('newHostIdentity').value.trim();
-            
-            if (hostname) options.HostName = hostname;
-            if (user) options.User = user;
-            if (port) options.Port = port;
-            if (identity) options.IdentityFile = identity;
-            
-            hosts.push({name, options});
-            renderHosts();
-            closeAddHostModal();
-            showMessage('Host added', 'success');
-        }
-        
-        function saveConfig() {
-            fetch('/api/save', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({hosts})
-            }).then(r => r.json()).then(data => {
-                if (data.success) showMessage('Configuration saved', 'success');
-                else showMessage('Save failed: ' + data.error, 'error');
-            }).catch(err => showMessage('Save failed: ' + err, 'error'));
-        }
-        
-        function showMessage(text, type) {
-            const msg = document.getElementById('message');
-            msg.textContent = text;
-            msg.className = 'message show ' + type;
-            setTimeout(() => msg.classList.remove('show'), 3000);
-        }
-        
-        function switchTab(e, tab) {
-            e.preventDefault();
-            document.querySelectorAll('.tab-content').forEach(el => el.classList.remove('active'));
-            document.getElementById(tab + '-content').classList.add('active');
-            document.querySelectorAll('.tab-button').forEach(btn => btn.classList.remove('active'));
-            e.target.classList.add('active');
-            if (tab === 'raw') loadRawConfig();
-        }
+    return asset_response(ASSETS['index'], immutable=False)
+
+@app.route('/static/<name>')
+def static_asset(name):
+    asset = ASSETS['files'].get(name)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    return asset_response(asset, immutable=True)
+
+@app.route('/api/config')
+def get_config():
+    try:
+        fmt = request.args.get('format', 'json')
+        if fmt not in ('json', 'ndjson'):
+            return jsonify({'error': 'format must be json or ndjson'}), 400
+        mimetype = 'application/json' if fmt == 'json' else 'application/x-ndjson'
         
-        function loadRawConfig() {
-            fetch('/api/config').then(r => r.json()).then(data => {
-                hosts = data.hosts;
-                fetch('/api/raw-config', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({hosts})
-                }).then(r => r.json()).then(data => {
-                    document.getElementById('rawEditor').value = data.config;
-                });
-            });
-        }
+        entry = peek_config_cache(g.tenant)
+        if entry is None:
+            key = config_stat_key(g.tenant)
+            if key is not None and (fmt == 'ndjson' or key[2] >= CONFIG_STREAM_THRESHOLD):
+                # Cold and large, or NDJSON: send hosts as they are read instead of parsing the
+                # whole file first. The content hash is not known until the end, so
+                # this response carries no ETag; the cache is filled once it is sent,
+                # and later requests get an ETag and can be answered with 304.
+                count_cache(False)
+                tenant = g.tenant
+                f = open(tenant['path'], 'r', encoding='utf-8', errors='surrogateescape', newline='\n')
+                mtime = os.fstat(f.fileno()).st_mtime
+                response = stream_response(stream_config_file(f, fmt), mimetype)
+                response.call_on_close(lambda: fill_config_cache(tenant))
+                response.last_modified = datetime.fromtimestamp(mtime, timezone.utc)
+                response.cache_control.no_cache = True
+                return response
+            entry = load_config_cached(g.tenant)
         
-        function saveRawConfig() {
-            const content = document.getElementById('rawEditor').value;
-            fetch('/api/save-raw', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({content})
-            }).then(r => r.json()).then(data => {
-                if (data.success) { showMessage('Saved', 'success'); loadConfig(); }
-                else showMessage('Save failed: ' + data.error, 'error');
-            }).catch(err => showMessage('Save failed: ' + err, 'error'));
-        }
+        if fmt == 'ndjson':
+            response = stream_response(stream_hosts_body(entry['hosts'], fmt), mimetype)
+        else:
+            body, encoding = encoded_body(get_config_body(entry), negotiate_encoding(request.accept_encodings))
+            response = app.response_class(body, mimetype=mimetype)
+            response.vary.add('Accept-Encoding')
+            if encoding != 'identity':
+                response.content_encoding = encoding
+        response.set_etag(entry['etag'])
+        if entry['last_modified'] is not None:
+            response.last_modified = entry['last_modified']
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/config/expanded')
+def get_expanded_config():
+    try:
+        expansion = expand_config(g.tenant['path'], config_home(g.tenant['path']), load_config_cached(g.tenant))
+        body = expansion.get('body')
+        if body is None:
+            hosts = [dict(section['host'].to_dict(), source=section['source'])
+                     for section in expansion['sections'] if section['host'] is not None]
+            files = [{'path': path, 'includes': info['includes']} for path, info in expansion['files'].items()]
+            expansion['body'] = json.dumps({'hosts': hosts, 'files': files, 'refused': expansion['refused']},
+                                           separators=(',', ':'))
+        body, encoding = encoded_body(expansion, negotiate_encoding(request.accept_encodings))
+        response = app.response_class(body, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        if encoding != 'identity':
+            response.content_encoding = encoding
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/resolve')
+def resolve_config():
+    try:
+        host = request.args.get('host', '').strip()
+        if not host:
+            return jsonify({'error': 'host is required'}), 400
+        return jsonify(resolve_host(get_host_matcher(g.tenant), host))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/resolve', methods=['POST'])
+def resolve_config_batch():
+    try:
+        hosts = (request.json or {}).get('hosts')
+        if not isinstance(hosts, list) or not all(isinstance(h, str) and h.strip() for h in hosts):
+            return jsonify({'error': 'hosts must be a list of hostnames'}), 400
+        if len(hosts) > RESOLVE_BATCH_MAX:
+            return jsonify({'error': f'at most {RESOLVE_BATCH_MAX} hosts per request'}), 400
         
-        function dragStart(event) {
-            draggedIndex = parseInt(event.target.closest('.host-card').dataset.index);
-            event.target.closest('.host-card').classList.add('dragging');
-        }
+        matcher = get_host_matcher(g.tenant)
+        return jsonify({'results': [resolve_host(matcher, h.strip()) for h in hosts]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/hosts')
+def list_hosts():
+    try:
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', HOSTS_PAGE_DEFAULT, type=int), 1), HOSTS_PAGE_MAX)
+        query = request.args.get('q', '').strip()
+        match = request.args.get('match', 'substring')
+        if match not in ('substring', 'prefix'):
+            return jsonify({'error': 'match must be substring or prefix'}), 400
         
-        function dragEnd(event) {
-            document.querySelectorAll('.host-card').forEach(card => {
-                card.classList.remove('dragging');
-                card.classList.remove('drag-over');
-            });
-        }
+        entry = load_config_cached(g.tenant)
+        hosts = entry['hosts']
+        if query:
+            positions = search_host_index(get_host_index(entry), hosts, query, match)
+        else:
+            positions = range(len(hosts))
+        page = positions[offset:offset + limit]
         
-        function dragOver(event) {
-            event.preventDefault();
-            const card = event.target.closest('.host-card');
-            if (card && draggedIndex !== null) card.classList.add('drag-over');
-        }
+        response = jsonify({
+            'hosts': [{'index': pos, 'name': hosts[pos].name, 'options': hosts[pos].options} for pos in page],
+            'total': len(positions),
+            'offset': offset,
+            'limit': limit,
+            'version': entry['etag'],
+        })
+        response.set_etag(entry['etag'])
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/config', methods=['PATCH'])
+def patch_config():
+    try:
+        data = request.json or {}
+        ops = data.get('ops')
+        if not isinstance(ops, list):
+            return jsonify({'success': False, 'error': 'ops must be a list'}), 400
         
-        function drop(event) {
-            event.preventDefault();
-            const card = event.target.closest('.host-card');
-            if (!card) return;
-            const dropIndex = parseInt(card.dataset.index);
-            if (draggedIndex !== null && draggedIndex !== dropIndex) {
-                const draggedHost = hosts.splice(draggedIndex, 1)[0];
-                const newIndex = draggedIndex < dropIndex ? dropIndex - 1 : dropIndex;
-                hosts.splice(newIndex, 0, draggedHost);
-                renderHosts();
-            }
-            document.querySelectorAll('.host-card').forEach(c => c.classList.remove('drag-over'));
-        }
+        with config_transaction(g.tenant):
+            entry = current_config_entry(g.tenant)
+            error = check_config_version(entry, data, required=True)
+            if error:
+                return error
+            try:
+                with timed('generate'):
+                    content = apply_config_patch(entry['parsed'], ops)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            ticket = queue_config_write(g.tenant, content, entry)
+        entry = finish_config_write(ticket)
         
-        loadConfig();
-    </script>
-</body>
-</html>'''
-    return render_template_string(html)
+        response = jsonify({'success': True, 'version': entry['etag'], 'diff': entry['diff']})
+        response.set_etag(entry['etag'])
+        return response
+    except LintError as e:
+        return jsonify({'success': False, 'error': str(e), 'issues': e.issues}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/config')
-def get_config():
+@app.route('/api/raw-config')
+def get_raw_file():
     try:
-        if os.path.exists(SSH_CONFIG_PATH):
-            with open(SSH_CONFIG_PATH, 'r') as f:
-                content = f.read()
-        else:
-            content = ""
-        hosts = parse_ssh_config(content)
-        return jsonify({'hosts': hosts})
+        entry = load_config_cached(g.tenant)
+        response = jsonify({'config': serialize_config(entry['parsed']), 'version': entry['etag']})
+        response.set_etag(entry['etag'])
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -406,7 +523,8 @@ def get_raw_config():
     try:
         data = request.json
         hosts = data.get('hosts', [])
-        config = generate_ssh_config(hosts)
+        with timed('generate'):
+            config = generate_ssh_config(hosts)
         return jsonify({'config': config})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -416,17 +534,23 @@ def save_config():
     try:
         data = request.json
         hosts = data.get('hosts', [])
-        config = generate_ssh_config(hosts)
-        
-        ssh_dir = os.path.dirname(SSH_CONFIG_PATH)
-        os.makedirs(ssh_dir, exist_ok=True)
-        with open(SSH_CONFIG_PATH, 'w') as f:
-            f.write(config)
         
-        if platform.system() != 'Windows':
-            os.chmod(SSH_CONFIG_PATH, 0o600)
+        with config_transaction(g.tenant):
+            entry = current_config_entry(g.tenant)
+            error = check_config_version(entry, data)
+            if error:
+                return error
+            try:
+                with timed('generate'):
+                    config = merge_ssh_config(entry['parsed'], hosts)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            ticket = queue_config_write(g.tenant, config, entry)
+        entry = finish_config_write(ticket)
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'version': entry['etag']})
+    except LintError as e:
+        return jsonify({'success': False, 'error': str(e), 'issues': e.issues}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -436,27 +560,291 @@ def save_raw_config():
         data = request.json
         content = data.get('content', '')
         
-        ssh_dir = os.path.dirname(SSH_CONFIG_PATH)
-        os.makedirs(ssh_dir, exist_ok=True)
-        with open(SSH_CONFIG_PATH, 'w') as f:
-            f.write(content)
+        with config_transaction(g.tenant):
+            entry = current_config_entry(g.tenant)
+            error = check_config_version(entry, data)
+            if error:
+                return error
+            ticket = queue_config_write(g.tenant, content, entry)
+        entry = finish_config_write(ticket)
         
-        if platform.system() != 'Windows':
-            os.chmod(SSH_CONFIG_PATH, 0o600)
+        return jsonify({'success': True, 'version': entry['etag']})
+    except LintError as e:
+        return jsonify({'success': False, 'error': str(e), 'issues': e.issues}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/import', methods=['POST'])
+def import_config():
+    try:
+        fmt = request.args.get('format') or guess_format(request.mimetype)
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({'success': False, 'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+        replace = request.args.get('replace', '').lower() in ('1', 'true', 'yes')
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+        try:
+            entry, counts = import_hosts(g.tenant, stream, fmt, replace,
+                                         check_version=lambda entry: check_config_version(entry, request.args))
+        except BulkImportError as e:
+            return jsonify({'success': False, 'error': str(e), 'errors': e.errors}), 400
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if counts is None:
+            return entry
         
-        return jsonify({'success': True})
+        response = jsonify({'success': True, 'version': entry['etag'], **counts})
+        response.set_etag(entry['etag'])
+        return response
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-if __name__ == '__main__':
-    if platform.system() == 'Windows':
+@app.route('/api/export')
+def export_config():
+    try:
+        fmt = request.args.get('format', 'json')
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+        entry = load_config_cached(g.tenant)
+        response = stream_response(stream_export(entry['hosts'], fmt), FORMAT_MIMETYPES[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename=ssh_config.{fmt}'
+        response.set_etag(entry['etag'])
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/events')
+def config_events():
+    # EventSource sends the id of the last event it saw when it reconnects
+    version = request.headers.get('Last-Event-ID') or request.args.get('version')
+    if not reserve_stream():
+        response = jsonify({'error': 'Too many open event streams'})
+        response.status_code = 503
+        response.retry_after = 30
+        return response
+    response = app.response_class(stream_events(g.tenant, version), mimetype='text/event-stream')
+    response.call_on_close(release_stream)
+    response.cache_control.no_cache = True
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/history')
+def get_history():
+    try:
+        limit = min(max(request.args.get('limit', HISTORY_PAGE_DEFAULT, type=int), 1), HISTORY_PAGE_MAX)
+        versions = list_versions(g.tenant['path'], limit, request.args.get('before', type=int))
+        return jsonify({'versions': versions})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/<int:version_id>')
+def get_history_version(version_id):
+    try:
+        version, content = version_content(g.tenant['path'], version_id)
+        return jsonify({'id': version_id, 'version': version, 'config': content})
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/diff')
+def diff_history():
+    try:
+        from_id = request.args.get('from', type=int)
+        to_id = request.args.get('to', type=int)
+        if from_id is None:
+            return jsonify({'error': 'from must be a version id'}), 400
+        if to_id is None:
+            to_id = latest_version_id(g.tenant['path'])
+        return jsonify(diff_versions(g.tenant['path'], from_id, to_id))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/<int:version_id>/rollback', methods=['POST'])
+def rollback_config(version_id):
+    try:
+        data = request.json or {}
+        
+        with config_transaction(g.tenant):
+            entry = current_config_entry(g.tenant)
+            error = check_config_version(entry, data)
+            if error:
+                return error
+            try:
+                _, content = version_content(g.tenant['path'], version_id)
+            except LookupError as e:
+                return jsonify({'success': False, 'error': str(e)}), 404
+            ticket = queue_config_write(g.tenant, content, entry, source=f'rollback:{version_id}')
+        entry = finish_config_write(ticket)
+        
+        response = jsonify({'success': True, 'version': entry['etag'], 'diff': entry['diff']})
+        response.set_etag(entry['etag'])
+        return response
+    except LintError as e:
+        return jsonify({'success': False, 'error': str(e), 'issues': e.issues}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def lint_response(parsed, limit, **fields):
+    """Lint a parsed config for the current tenant and describe the result as JSON"""
+    issues = lint_config(parsed, config_home(g.tenant['path']))
+    counts = {'error': 0, 'warning': 0}
+    for issue in issues:
+        counts[issue['severity']] += 1
+    return jsonify(dict(fields, counts=counts, issues=issues[:limit], truncated=len(issues) > limit))
+
+@app.route('/api/lint')
+def lint_saved_config():
+    try:
+        limit = min(max(request.args.get('limit', LINT_ISSUES_MAX, type=int), 0), 10 * LINT_ISSUES_MAX)
+        entry = load_config_cached(g.tenant)
+        return lint_response(entry['parsed'], limit, version=entry['etag'])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/lint', methods=['POST'])
+def lint_proposed_config():
+    try:
+        data = request.json or {}
+        content = data.get('content')
+        if not isinstance(content, str):
+            return jsonify({'error': 'content must be a string'}), 400
+        limit = min(max(request.args.get('limit', LINT_ISSUES_MAX, type=int), 0), 10 * LINT_ISSUES_MAX)
+        # Blocks the saved config also has are not parsed again
+        parsed, _ = parse_ssh_config_incremental(content, load_config_cached(g.tenant)['parsed'])
+        return lint_response(parsed, limit)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stats')
+def get_stats():
+    return jsonify({'writer': get_writer_metrics(), 'cache': get_cache_metrics()})
+
+@app.route('/metrics')
+def get_metrics():
+    writer = get_writer_metrics()
+    cache = get_cache_metrics()
+    extra = [
+        ('ssh_config_saves_total', 'counter', 'Saves accepted', writer['saves']),
+        ('ssh_config_coalesced_saves_total', 'counter', 'Saves that joined another save\'s write', writer['coalesced_saves']),
+        ('ssh_config_writes_total', 'counter', 'Config files written', writer['writes']),
+        ('ssh_config_write_errors_total', 'counter', 'Config writes that failed', writer['write_errors']),
+        ('ssh_config_post_write_errors_total', 'counter', 'Post-write hooks that failed', writer['post_write_errors']),
+        ('ssh_config_written_bytes_total', 'counter', 'Config bytes written to disk', writer['bytes_written']),
+        ('ssh_config_cache_evictions_total', 'counter', 'Parsed configs dropped from memory', cache['evictions']),
+        ('ssh_config_cached_tenants', 'gauge', 'Tenants with a parsed config in memory', cache['cached_tenants']),
+        ('ssh_config_cached_bytes_estimate', 'gauge', 'Estimated memory held by parsed configs', cache['cached_bytes_estimate']),
+    ]
+    return app.response_class(render_metrics(extra), mimetype=PROMETHEUS_MIMETYPE)
+
+def serve(host, port, threads, workers, use_gevent=False):
+    """Run the app on a production WSGI server
+
+    One worker is served by waitress with `threads` threads; more workers
+    are separate gunicorn processes (Unix only) with `threads` threads each.
+    With use_gevent requests run as greenlets instead of threads, so open
+    event streams cost no thread. Saves stay safe across workers through
+    the store's file lock.
+    """
+    if use_gevent:
+        from gevent.pywsgi import WSGIServer
+    else:
+        # Each open event stream holds a thread; keep the other half for API requests
+        set_stream_limit(max(1, threads // 2))
+    if workers > 1:
+        from gunicorn.app.base import BaseApplication
+        
+        class Server(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', f'{host}:{port}')
+                self.cfg.set('workers', workers)
+                self.cfg.set('threads', threads)
+                self.cfg.set('worker_class', 'gevent' if use_gevent else 'gthread')
+            
+            def load(self):
+                return app
+        
+        Server().run()
+    elif use_gevent:
+        WSGIServer((host, port), app).serve_forever()
+    else:
+        from waitress import serve as waitress_serve
+        waitress_serve(app, host=host, port=port, threads=threads)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='app.py', description='SSH config editor')
+    commands = parser.add_subparsers(dest='command')
+    serve_parser = commands.add_parser('serve', help='run with a production WSGI server')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=5000)
+    serve_parser.add_argument('--threads', type=int, default=8, help='threads per worker (default 8)')
+    serve_parser.add_argument('--workers', type=int, default=1, help='worker processes; more than 1 needs gunicorn (default 1)')
+    serve_parser.add_argument('--gevent', action='store_true', help='serve requests as greenlets, for many open event streams (needs gevent)')
+    import_parser = commands.add_parser('import', help='add or update hosts from a CSV, JSON or NDJSON file')
+    import_parser.add_argument('file', help="input file, or - for stdin")
+    import_parser.add_argument('--format', choices=IMPORT_FORMATS, help='input format (default: from the file extension)')
+    import_parser.add_argument('--replace', action='store_true', help="replace existing hosts' options instead of merging")
+    import_parser.add_argument('--tenant', default='', help='tenant whose config to change (see SSH_CONFIG_PATH_TEMPLATE)')
+    export_parser = commands.add_parser('export', help='write the hosts as CSV, JSON or NDJSON')
+    export_parser.add_argument('file', nargs='?', default='-', help='output file, or - for stdout (default)')
+    export_parser.add_argument('--format', choices=IMPORT_FORMATS, help='output format (default: from the file extension, else json)')
+    export_parser.add_argument('--tenant', default='', help='tenant whose config to read (see SSH_CONFIG_PATH_TEMPLATE)')
+    args = parser.parse_args(argv)
+    
+    if args.command in ('import', 'export'):
+        fmt = args.format or guess_format(args.file)
+        try:
+            tenant = get_tenant(args.tenant)
+        except LookupError as e:
+            print(e, file=sys.stderr)
+            return 1
+        if args.command == 'export':
+            hosts = load_config_cached(tenant)['hosts']
+            out = open(args.file, 'w', encoding='utf-8', newline='') if args.file != '-' else sys.stdout
+            try:
+                out.writelines(stream_export(hosts, fmt or 'json'))
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            return 0
+        if fmt is None:
+            print('Cannot tell the input format; pass --format', file=sys.stderr)
+            return 1
         try:
-            from waitress import serve
+            with (open(args.file, encoding='utf-8-sig', newline='') if args.file != '-'
+                  else io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')) as stream:
+                entry, counts = import_hosts(tenant, stream, fmt, args.replace)
+        except BulkImportError as e:
+            print(e, file=sys.stderr)
+            for error in e.errors:
+                print(f'  {error}', file=sys.stderr)
+            return 1
+        except (OSError, ValueError) as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"{counts['added']} added, {counts['updated']} updated, {counts['unchanged']} unchanged")
+        return 0
+    elif args.command == 'serve':
+        try:
+            serve(args.host, args.port, args.threads, args.workers, args.gevent)
+        except ImportError as e:
+            package = e.name.split('.')[0] if e.name else 'waitress'
+            print(f'Need to install {package}: pip install {package}')
+            return 1
+    elif platform.system() == 'Windows':
+        try:
+            from waitress import serve as waitress_serve
             print('SSH Config Editor running at http://localhost:5000')
             print('Press Ctrl+C to stop the service')
-            serve(app, host='127.0.0.1', port=5000)
+            waitress_serve(app, host='127.0.0.1', port=5000)
         except ImportError:
             print('Need to install waitress: pip install waitress')
             app.run(host='127.0.0.1', port=5000, use_reloader=False)
     else:
-        app.run(debug=True, port=5000)
\ No newline at end of file
+        app.run(debug=True, port=5000)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""Static UI assets: content-hashed, precompressed and held in memory
+
+The files in static/ are read once. Every asset other than index.html is
+published under a name carrying a hash of its content (editor.js becomes
+editor.<hash>.js) so browsers can cache it forever, and /static/<name>
+references in index.html are rewritten to those names; index.html itself is
+revalidated through its ETag. Each asset is kept gzip-compressed, and
+brotli-compressed as well when the optional brotli package is installed.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+ASSET_REF_RE = re.compile(r'''(?<=["'])/static/([\w.-]+)(?=["'])''')
+
+# Encodings offered, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = 1024
+
+def compress(data, encoding, static=False):
+    """Compress data; static assets are compressed once, so they get the slowest, smallest settings"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else 4)
+    return gzip.compress(data, compresslevel=9 if static else 6, mtime=0)
+
+def gzip_stream(chunks):
+    """Gzip an iterable of str chunks, flushing after each so streamed responses keep flowing"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8', 'surrogateescape') if isinstance(chunk, str) else chunk)
+        yield data + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def negotiate_encoding(accept_encodings, available=ENCODINGS):
+    """Pick the preferred encoding the client accepts (a werkzeug Accept), or 'identity'"""
+    for encoding in ENCODINGS:
+        if encoding in available and accept_encodings[encoding] > 0:
+            return encoding
+    return 'identity'
+
+def build_asset(name, data):
+    """Return the served form of one file: its hashed URL, type, ETag and encoded bodies"""
+    digest = hashlib.sha256(data).hexdigest()
+    if name == 'index.html':
+        url = '/'
+    else:
+        stem, ext = os.path.splitext(name)
+        url = f'/static/{stem}.{digest[:12]}{ext}'
+    bodies = {'identity': data}
+    if len(data) >= COMPRESS_MIN_SIZE:
+        for encoding in ENCODINGS:
+            encoded = compress(data, encoding, static=True)
+            if len(encoded) < len(data):
+                bodies[encoding] = encoded
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    return {'name': name, 'url': url, 'mimetype': mimetype, 'etag': digest[:32], 'bodies': bodies}
+
+def load_assets(directory=STATIC_DIR):
+    """Build every asset in directory; returns {'index': asset, 'files': {hashed file name: asset}}"""
+    files = {}
+    urls = {}
+    for name in sorted(os.listdir(directory)):
+        if name == 'index.html' or not os.path.isfile(os.path.join(directory, name)):
+            continue
+        with open(os.path.join(directory, name), 'rb') as f:
+            asset = build_asset(name, f.read())
+        files[os.path.basename(asset['url'])] = asset
+        urls[name] = asset['url']
+    
+    with open(os.path.join(directory, 'index.html'), encoding='utf-8') as f:
+        page = f.read()
+    page = ASSET_REF_RE.sub(lambda m: urls.get(m.group(1), m.group(0)), page)
+    return {'index': build_asset('index.html', page.encode('utf-8')), 'files': files}
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""History benchmark: snapshot cost, storage per save and diff time on large configs
+
+Records a generated config as a version, then a series of saves that each
+edit one host, and reports the time to record each save, the database
+growth per save against storing a full copy, and the time to diff the first
+and last versions and to read a version back for rollback.
+
+    python benchmarks/history.py [--sizes 1000,10000,100000] [--saves 20]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import diff_versions, history_path, record_version, version_content  # noqa: E402
+from roundtrip import generate_corpus_config  # noqa: E402
+from sshconfig import parse_ssh_config_incremental, set_block_option  # noqa: E402
+
+def database_size(path):
+    """Bytes used by the history database, its write-ahead log included"""
+    db_path = history_path(path)
+    return sum(os.path.getsize(db_path + suffix) for suffix in ('', '-wal') if os.path.exists(db_path + suffix))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated host counts')
+    parser.add_argument('--saves', type=int, default=20, help='one-host edits recorded after the first version')
+    args = parser.parse_args()
+    
+    for size in (int(s) for s in args.sizes.split(',')):
+        directory = tempfile.mkdtemp(prefix='ssh-config-history-')
+        try:
+            path = os.path.join(directory, 'config')
+            content = generate_corpus_config(size, seed=size)
+            parsed, _ = parse_ssh_config_incremental(content)
+            started = time.perf_counter()
+            first = record_version(path, parsed, 'v0')
+            first_seconds = time.perf_counter() - started
+            first_size = database_size(path)
+            
+            rnd = random.Random(size)
+            record_seconds = []
+            last = first
+            for n in range(args.saves):
+                texts = list(parsed['texts'])
+                i = rnd.choice(parsed['host_blocks'])
+                texts[i] = set_block_option(texts[i], 'ServerAliveInterval', str(n + 1))
+                parsed, _ = parse_ssh_config_incremental(''.join(texts), parsed)
+                started = time.perf_counter()
+                last = record_version(path, parsed, f'v{n + 1}')
+                record_seconds.append(time.perf_counter() - started)
+            growth = (database_size(path) - first_size) / max(args.saves, 1)
+            
+            started = time.perf_counter()
+            diff = diff_versions(path, first, last)
+            diff_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            version_content(path, last)
+            read_seconds = time.perf_counter() - started
+            
+            average = sum(record_seconds) / len(record_seconds) if record_seconds else 0.0
+            print(f"{size:>7} hosts  {len(content) / 1e6:6.1f} MB  first version {first_seconds * 1000:7.1f}ms"
+                  f"  save {average * 1000:6.1f}ms  +{growth / 1024:7.1f} KB/save ({growth / len(content):.2%} of a copy)"
+                  f"  diff {diff_seconds * 1000:6.1f}ms ({len(diff['modified'])} modified)  read {read_seconds * 1000:6.1f}ms")
+        finally:
+            shutil.rmtree(directory)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,56 @@
+"""Lint benchmark: time per host as the config grows
+
+Lints generated configs of each size (in the styles of real configs,
+wildcard sections included) and reports the time for a full lint and for
+the pre-save check of a one-line edit. A full lint that stays linear keeps
+its time per host flat from the smallest size to the largest.
+
+    python benchmarks/lint.py [--sizes 1000,10000,100000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lint import lint_changes, lint_config  # noqa: E402
+from roundtrip import generate_corpus_config  # noqa: E402
+from sshconfig import parse_ssh_config_incremental  # noqa: E402
+
+def best_of(repeat, run):
+    """Return (result, fastest seconds) over `repeat` runs"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated host counts')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement; the fastest is reported')
+    args = parser.parse_args()
+    
+    baseline = None
+    for size in (int(s) for s in args.sizes.split(',')):
+        content = generate_corpus_config(size, seed=size)
+        parsed, _ = parse_ssh_config_incremental(content)
+        issues, full_seconds = best_of(args.repeat, lambda: lint_config(parsed, check_files=False))
+        
+        # The pre-save hook only checks the blocks an edit changed
+        edited = content.replace('\nHost ', '\nHost lint-bench\n    Port 2222\n\nHost ', 1)
+        edited_parsed, _ = parse_ssh_config_incremental(edited, parsed)
+        _, change_seconds = best_of(args.repeat, lambda: lint_changes(edited_parsed, parsed))
+        
+        per_host = full_seconds / size * 1e6
+        baseline = baseline or per_host
+        print(f"{size:>7} hosts  lint {full_seconds * 1000:8.1f}ms  {per_host:6.2f}us/host ({per_host / baseline:4.2f}x)"
+              f"  {len(issues):>6} issues  one-line edit {change_seconds * 1000:7.1f}ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
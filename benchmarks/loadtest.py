@@ -0,0 +1,138 @@
+"""Load test for GET /api/config and POST /api/save
+
+Starts `app.py serve` on a generated config in a scratch HOME (or targets a
+running server with --url), then drives each endpoint from N client threads
+over keep-alive connections at every concurrency level and reports
+requests/sec and latency percentiles. Saves re-submit the unchanged host
+list, so a --url target's config keeps its content, but it is rewritten.
+
+    python benchmarks/loadtest.py [--hosts 2000] [--concurrency 1,8,32]
+                                  [--duration 5] [--threads 8] [--workers 1]
+                                  [--url http://127.0.0.1:5000]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from roundtrip import generate_corpus_config  # noqa: E402
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+def start_server(hosts, port, threads, workers):
+    """Run app.py serve with HOME pointing at a scratch dir holding a generated config"""
+    home = tempfile.mkdtemp(prefix='ssh-config-loadtest-')
+    os.makedirs(os.path.join(home, '.ssh'))
+    with open(os.path.join(home, '.ssh', 'config'), 'w', encoding='utf-8', errors='surrogateescape', newline='') as f:
+        f.write(generate_corpus_config(hosts, seed=hosts))
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    process = subprocess.Popen(
+        [sys.executable, APP, 'serve', '--port', str(port), '--threads', str(threads), '--workers', str(workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('server did not start')
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def run_level(url, method, path, body, concurrency, duration):
+    """Hit one endpoint from `concurrency` threads for `duration` seconds; returns latencies and status counts"""
+    parts = urlsplit(url)
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    
+    def client():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        mine = []
+        codes = {}
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+                status = 'error'
+            mine.append(time.perf_counter() - started)
+            codes[status] = codes.get(status, 0) + 1
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            for status, count in codes.items():
+                statuses[status] = statuses.get(status, 0) + count
+    
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.monotonic() - started
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', help='test a running server instead of starting one')
+    parser.add_argument('--hosts', type=int, default=2000, help='hosts in the generated config')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated client thread counts')
+    parser.add_argument('--duration', type=float, default=5, help='seconds per endpoint and level')
+    parser.add_argument('--threads', type=int, default=8, help='server threads per worker')
+    parser.add_argument('--workers', type=int, default=1, help='server worker processes')
+    args = parser.parse_args()
+    
+    process = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        process = start_server(args.hosts, port, args.threads, args.workers)
+        url = f'http://127.0.0.1:{port}'
+    try:
+        parts = urlsplit(url)
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        conn.request('GET', '/api/config')
+        hosts = json.loads(conn.getresponse().read())['hosts']
+        conn.close()
+        save_body = json.dumps({'hosts': hosts})
+        
+        print(f'{url}  {len(hosts)} hosts  {args.duration:g}s per run')
+        for method, path, body in (('GET', '/api/config', None), ('POST', '/api/save', save_body)):
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                latencies, statuses, elapsed = run_level(url, method, path, body, concurrency, args.duration)
+                codes = ' '.join(f'{status}:{count}' for status, count in sorted(statuses.items(), key=str))
+                print(f'{method:<4} {path:<12} c={concurrency:<4} {len(latencies) / elapsed:8.1f} req/s'
+                      f'  p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  p99 {percentile(latencies, 0.99) * 1000:7.1f}ms  {codes}')
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
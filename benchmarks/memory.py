@@ -0,0 +1,100 @@
+"""Memory benchmark for parsed hosts: Host records against nested dicts
+
+Parses a generated config into the slotted Host records the app keeps and
+into the {'name': ..., 'options': {...}} dicts it used to keep, and reports
+the memory each retains (measured with tracemalloc) and the time to parse
+and to convert the records to dicts for a JSON response.
+
+    python benchmarks/memory.py [--sizes 10000,50000] [--options 8]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sshconfig import parse_block, parse_ssh_config, split_config_blocks, split_directive  # noqa: E402
+
+OPTION_LINES = [
+    ('HostName', lambda rnd, i: f'10.{i % 256}.{i // 256 % 256}.{rnd.randint(1, 254)}'),
+    ('User', lambda rnd, i: rnd.choice(['deploy', 'ubuntu', 'root', 'ec2-user'])),
+    ('Port', lambda rnd, i: str(rnd.randint(1024, 65535))),
+    ('IdentityFile', lambda rnd, i: f'~/.ssh/{rnd.choice(["prod", "stage", "dev"])}_ed25519'),
+    ('ServerAliveInterval', lambda rnd, i: '30'),
+    ('ForwardAgent', lambda rnd, i: rnd.choice(['yes', 'no'])),
+    ('ProxyJump', lambda rnd, i: f'bastion{rnd.randint(1, 4)}'),
+    ('StrictHostKeyChecking', lambda rnd, i: 'accept-new'),
+    ('ControlMaster', lambda rnd, i: 'auto'),
+    ('ControlPath', lambda rnd, i: '~/.ssh/cm-%r@%h:%p'),
+]
+
+def generate_config(hosts, options, seed=0):
+    """Build a config of `hosts` Host blocks with `options` options each"""
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(hosts):
+        lines.append(f'Host web{i}')
+        for keyword, value in OPTION_LINES[:options]:
+            lines.append(f'    {keyword} {value(rnd, i)}')
+    return '\n'.join(lines) + '\n'
+
+def parse_hosts_as_dicts(content):
+    """The previous representation: one dict per host holding an options dict keyed by fresh lowercase strings"""
+    hosts = []
+    for text in split_config_blocks(content):
+        host = None
+        for line in text.split('\n'):
+            directive = split_directive(line)
+            if directive is None:
+                continue
+            keyword, value = directive
+            if keyword.lower() == 'host' and host is None:
+                host = {'name': value, 'options': {}}
+            elif host is not None:
+                host['options'][keyword.lower()] = value
+        if host is not None:
+            hosts.append(host)
+    return hosts
+
+def retained(build):
+    """Return (result, bytes still allocated by build(), seconds an untraced build() takes)"""
+    started = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='10000,50000', help='comma-separated host counts')
+    parser.add_argument('--options', type=int, default=8, help=f'options per host (at most {len(OPTION_LINES)})')
+    args = parser.parse_args()
+    
+    for size in (int(s) for s in args.sizes.split(',')):
+        content = generate_config(size, min(args.options, len(OPTION_LINES)), seed=size)
+        # Warm the keyword table so that both runs measure only the hosts
+        parse_block(content[:content.find('Host', 1)])
+        
+        dicts, dict_bytes, dict_seconds = retained(lambda: parse_hosts_as_dicts(content))
+        del dicts
+        records, record_bytes, record_seconds = retained(lambda: parse_ssh_config(content))
+        started = time.perf_counter()
+        [host.to_dict() for host in records]
+        convert_seconds = time.perf_counter() - started
+        del records
+        
+        print(f"{size:>7} hosts  {len(content):>10} bytes of config")
+        print(f"    dicts    {dict_bytes / 1e6:8.1f} MB  {dict_bytes / size:6.0f} B/host  parse {dict_seconds * 1000:7.1f}ms")
+        print(f"    records  {record_bytes / 1e6:8.1f} MB  {record_bytes / size:6.0f} B/host  parse {record_seconds * 1000:7.1f}ms"
+              f"  to_dict {convert_seconds * 1000:.1f}ms  ({1 - record_bytes / dict_bytes:.0%} smaller)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""Round-trip check and benchmark for the lossless config model
+
+Generates configs shaped like real fleet configs (global options, comments,
+Include, Match blocks, wildcard hosts, CRLF files, Keyword=value syntax,
+non-UTF-8 bytes) and verifies that parsing and re-serializing them is
+byte-identical, that saving an unchanged host list is a no-op, and that a
+single-option edit only touches its own line.
+
+    python benchmarks/roundtrip.py [--sizes 1000,10000,50000] [--write DIR]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sshconfig import (  # noqa: E402
+    apply_config_patch,
+    merge_ssh_config,
+    parse_ssh_config_incremental,
+    serialize_config,
+)
+
+def generate_corpus_config(hosts, seed=0, eol='\n'):
+    """Build a config with `hosts` Host blocks in the styles found in real configs"""
+    rnd = random.Random(seed)
+    lines = [
+        '# ~/.ssh/config generated by inventory sync',
+        '# caf\udce9 owner: ops',
+        'Include conf.d/*.conf',
+        'ServerAliveInterval=30',
+        'AddKeysToAgent yes',
+        '',
+    ]
+    for i in range(hosts):
+        env = rnd.choice(['prod', 'stage', 'dev'])
+        if i % 500 == 0:
+            lines += [f'Match host *.{env}.example.com exec "test -f ~/.ssh/{env}"', '    User svc-' + env, '']
+        if i % 1000 == 0:
+            lines += [f'Host *.{env}.example.com', '    ProxyJump bastion.' + env, '    StrictHostKeyChecking yes', '']
+        indent = rnd.choice(['    ', '  ', '\t'])
+        lines.append(f'Host web{i}.{env} web{i}' if rnd.random() < 0.3 else f'Host web{i}.{env}')
+        if rnd.random() < 0.1:
+            lines.append(f'{indent}# rack {rnd.randint(1, 40)}, owner team-{rnd.randint(1, 9)}')
+        lines.append(f'{indent}HostName 10.{i % 256}.{i // 256 % 256}.{rnd.randint(1, 254)}')
+        lines.append(f'{indent}User {rnd.choice(["deploy", "ubuntu", "root", "ec2-user"])}')
+        if rnd.random() < 0.3:
+            lines.append(f'{indent}Port={rnd.randint(1024, 65535)}')
+        if rnd.random() < 0.2:
+            lines += [f'{indent}IdentityFile ~/.ssh/{env}_ed25519', f'{indent}IdentityFile ~/.ssh/{env}_rsa']
+        if rnd.random() < 0.05:
+            lines.append(f'{indent}LocalForward {rnd.randint(1024, 9999)} localhost:5432')
+        if rnd.random() < 0.05:
+            lines.append(f'{indent}ProxyCommand "ssh -W %h:%p bastion.{env}"')
+        if rnd.random() < 0.3:
+            lines.append('')
+    lines += ['Host *', '    ForwardAgent no']
+    # Real files often lack the final newline
+    return eol.join(lines)
+
+def check_roundtrip(content):
+    """Return a list of failures for one config, plus timings"""
+    failures = []
+    timings = {}
+    
+    started = time.perf_counter()
+    parsed, _ = parse_ssh_config_incremental(content)
+    timings['parse'] = time.perf_counter() - started
+    if serialize_config(parsed) != content:
+        failures.append('parse/serialize is not byte-identical')
+    
+    started = time.perf_counter()
+    parse_ssh_config_incremental(content, parsed)
+    timings['reparse_unchanged'] = time.perf_counter() - started
+    
+    hosts = [host.to_dict() for host in parsed['hosts']]
+    started = time.perf_counter()
+    if merge_ssh_config(parsed, hosts) != content:
+        failures.append('saving the unchanged host list changed the file')
+    timings['merge_unchanged'] = time.perf_counter() - started
+    
+    target = len(parsed['hosts']) // 2
+    while parsed['hosts'][target].get('user') is None:
+        target += 1
+    started = time.perf_counter()
+    edited = apply_config_patch(parsed, [{'op': 'set_option', 'index': target, 'key': 'User', 'value': 'edited'}])
+    timings['patch_one_option'] = time.perf_counter() - started
+    prefix = 0
+    while prefix < min(len(edited), len(content)) and edited[prefix] == content[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(edited), len(content)) - prefix and edited[-1 - suffix] == content[-1 - suffix]:
+        suffix += 1
+    changed = edited[prefix:len(edited) - suffix]
+    if '\n' in changed or 'edited' not in edited[prefix - 20:len(edited) - suffix + 20]:
+        failures.append(f'single-option edit touched more than one line: {changed!r}')
+    
+    started = time.perf_counter()
+    reparsed, diff = parse_ssh_config_incremental(edited, parsed)
+    timings['reparse_after_edit'] = time.perf_counter() - started
+    if diff['modified'] != [parsed['hosts'][target].name] or diff['added'] or diff['removed']:
+        failures.append(f'unexpected diff after edit: {diff}')
+    return failures, timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,50000', help='comma-separated host counts')
+    parser.add_argument('--write', metavar='DIR', help='also write the generated corpus to DIR')
+    args = parser.parse_args()
+    
+    failed = False
+    for size in (int(s) for s in args.sizes.split(',')):
+        for eol in ('\n', '\r\n'):
+            content = generate_corpus_config(size, seed=size, eol=eol)
+            name = f'config-{size}-{"crlf" if eol == chr(13) + chr(10) else "lf"}'
+            if args.write:
+                os.makedirs(args.write, exist_ok=True)
+                with open(os.path.join(args.write, name), 'w', encoding='utf-8', errors='surrogateescape', newline='') as f:
+                    f.write(content)
+            failures, timings = check_roundtrip(content)
+            summary = '  '.join(f'{key}={value * 1000:.1f}ms' for key, value in timings.items())
+            print(f"{name:<20} {len(content.encode('utf-8', 'surrogateescape')):>10} bytes  {'FAIL' if failures else 'ok'}  {summary}")
+            for failure in failures:
+                print(f'    {failure}')
+            failed = failed or bool(failures)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
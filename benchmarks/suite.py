@@ -0,0 +1,159 @@
+"""Benchmark suite: parse, generate and API latency from 100 to 100,000 hosts
+
+Generates configs shaped like real ones at each size and times, taking the
+fastest of --repeat runs:
+
+    parse        parse_ssh_config on the whole file
+    reparse      parse_ssh_config_incremental after a one-host edit
+    generate     generate_ssh_config from the host list
+    get_cold     GET /api/config right after the file changed on disk (streamed
+                 from disk for configs over SSH_CONFIG_STREAM_THRESHOLD)
+    get_warm     GET /api/config served from the cache
+    patch        PATCH /api/config setting one option
+    save         POST /api/save with the full host list
+
+API timings go through the Flask test client against a scratch tenant per
+size, so they include the store, the pre-save lint and the version history
+but no network. --output writes the results as JSON; --compare reads such a
+file and exits with status 1 when a timing is more than --threshold times
+its baseline.
+
+    python benchmarks/suite.py [--sizes 100,1000,10000,100000] [--repeat 3]
+                               [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCRATCH = tempfile.mkdtemp(prefix='ssh-config-suite-')
+# The app reads these when it is imported
+os.environ['SSH_CONFIG_PATH_TEMPLATE'] = os.path.join(SCRATCH, '{tenant}', 'config')
+os.environ['SSH_CONFIG_WATCH_INTERVAL'] = '0'
+
+from roundtrip import generate_corpus_config  # noqa: E402
+from sshconfig import generate_ssh_config, parse_ssh_config, parse_ssh_config_incremental, set_block_option  # noqa: E402
+
+import app as webapp  # noqa: E402
+
+BENCHMARKS = ('parse', 'reparse', 'generate', 'get_cold', 'get_warm', 'patch', 'save')
+# Differences smaller than this are noise, whatever the ratio
+NOISE_FLOOR = 0.002
+
+def best_of(repeat, run, setup=None):
+    """Fastest of `repeat` runs of run(), calling setup() untimed before each"""
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def request(client, method, path, tenant, **kwargs):
+    # Named tenants need an authenticated user, which a proxy would pass as REMOTE_USER
+    response = client.open(path, method=method, headers={webapp.TENANT_HEADER: tenant},
+                           environ_overrides={'REMOTE_USER': tenant}, **kwargs)
+    response.get_data()
+    response.close()
+    if response.status_code != 200:
+        raise RuntimeError(f'{method} {path}: {response.status_code} {response.get_data(as_text=True)[:200]}')
+    return response
+
+def run_size(size, repeat):
+    content = generate_corpus_config(size, seed=size)
+    results = {}
+    results['parse'] = best_of(repeat, lambda: parse_ssh_config(content))
+    parsed, _ = parse_ssh_config_incremental(content)
+    i = parsed['host_blocks'][len(parsed['host_blocks']) // 2]
+    texts = list(parsed['texts'])
+    texts[i] = set_block_option(texts[i], 'Port', '2222')
+    edited = ''.join(texts)
+    results['reparse'] = best_of(repeat, lambda: parse_ssh_config_incremental(edited, parsed))
+    hosts = [host.to_dict() for host in parsed['hosts']]
+    results['generate'] = best_of(repeat, lambda: generate_ssh_config(hosts))
+    
+    tenant = f'hosts{size}'
+    path = os.environ['SSH_CONFIG_PATH_TEMPLATE'].replace('{tenant}', tenant)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8', errors='surrogateescape', newline='') as f:
+        f.write(content)
+    client = webapp.app.test_client()
+    
+    def touch():
+        # A new mtime invalidates the cached parse
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    
+    results['get_cold'] = best_of(repeat, lambda: request(client, 'GET', '/api/config', tenant), touch)
+    # A cold request fills the cache in the background once it is sent; wait for that
+    webapp.load_config_cached(webapp.get_tenant(tenant))
+    results['get_warm'] = best_of(repeat, lambda: request(client, 'GET', '/api/config', tenant))
+    name = parsed['hosts'][len(parsed['hosts']) // 2].name
+    counter = iter(range(1, 1 << 30))
+    
+    def patch():
+        version = request(client, 'GET', '/api/raw-config', tenant).get_json()['version']
+        ops = [{'op': 'set_option', 'name': name, 'key': 'ServerAliveInterval', 'value': str(next(counter))}]
+        return {'version': version, 'ops': ops}
+    
+    bodies = []
+    results['patch'] = best_of(repeat, lambda: request(client, 'PATCH', '/api/config', tenant, json=bodies[-1]),
+                               lambda: bodies.append(patch()))
+    results['save'] = best_of(repeat, lambda: request(client, 'POST', '/api/save', tenant, json={'hosts': hosts}))
+    return results
+
+def compare(results, baseline, threshold):
+    """Print timings that regressed against a baseline; returns how many did"""
+    regressions = 0
+    for size, timings in results.items():
+        for benchmark, seconds in timings.items():
+            before = baseline.get(size, {}).get(benchmark)
+            if before is None:
+                continue
+            if seconds > before * threshold and seconds - before > NOISE_FLOOR:
+                regressions += 1
+                print(f'REGRESSION {size:>7} hosts  {benchmark:<9} {before * 1000:9.2f}ms -> {seconds * 1000:9.2f}ms'
+                      f'  ({seconds / before:.2f}x)')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='100,1000,10000,100000', help='comma-separated host counts')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark; the fastest is reported')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file from an earlier --output')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown against the baseline that fails')
+    args = parser.parse_args()
+    
+    print(f"{'hosts':>7}  " + ''.join(f'{benchmark:>11}' for benchmark in BENCHMARKS) + '   (ms)')
+    results = {}
+    try:
+        for size in (int(s) for s in args.sizes.split(',')):
+            timings = run_size(size, args.repeat)
+            results[str(size)] = timings
+            print(f'{size:>7}  ' + ''.join(f'{timings[benchmark] * 1000:11.2f}' for benchmark in BENCHMARKS))
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(f'{regressions} regression{"s" if regressions != 1 else ""} against {args.compare}')
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
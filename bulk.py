@@ -0,0 +1,254 @@
+"""Bulk host import and export in CSV, JSON and NDJSON
+
+Imports are read as a stream of records, one host each: a CSV row with a
+name column and one column per option, an NDJSON line, or an item of a JSON
+array (bare or under "hosts", as /api/config returns it). JSON records are
+{"name": ..., "options": {...}} or flat {"name": ..., "HostName": ...}.
+Records are validated a batch at a time as they arrive and spooled to a
+temporary file, so the input is never held in memory whole and can be read
+before the config is locked; upsert_ssh_config() then applies them.
+"""
+import csv
+import io
+import itertools
+import json
+import os
+import tempfile
+
+from sshconfig import validate_hosts
+
+IMPORT_FORMATS = ('csv', 'json', 'ndjson')
+FORMAT_EXTENSIONS = {'.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+FORMAT_MIMETYPES = {'csv': 'text/csv', 'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+# Columns or JSON fields holding the host alias; every other one is an option
+NAME_FIELDS = ('name', 'host')
+IMPORT_BATCH_SIZE = 1000
+# Validation stops after this many bad rows
+IMPORT_MAX_ERRORS = 100
+READ_CHUNK_SIZE = 64 * 1024
+# A JSON record that is still incomplete after this many characters is reported as malformed
+JSON_RECORD_MAX = 1024 * 1024
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+class BulkImportError(ValueError):
+    """Rows of an import failed validation; errors lists them as 'row N: message'"""
+    
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} row{'s' if len(errors) != 1 else ''} failed validation")
+        self.errors = errors
+
+def guess_format(name):
+    """Return the import format for a file name or content type, or None"""
+    name = (name or '').split(';')[0].strip().lower()
+    for fmt, mimetype in FORMAT_MIMETYPES.items():
+        if name == mimetype:
+            return fmt
+    return FORMAT_EXTENSIONS.get(os.path.splitext(name)[1])
+
+def _flat_record(item):
+    """Accept {"name", "options"} records as they are and turn flat ones into that form"""
+    if not isinstance(item, dict) or 'options' in item:
+        return item
+    name = next((item[field] for field in NAME_FIELDS if field in item), None)
+    return {'name': name, 'options': {k: v for k, v in item.items() if k not in NAME_FIELDS}}
+
+def _csv_records(stream):
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [column.strip() for column in header]
+    try:
+        name_column = next(i for i, column in enumerate(columns) if column.lower() in NAME_FIELDS)
+    except StopIteration:
+        raise ValueError('CSV input needs a name column') from None
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        options = {}
+        for i, cell in enumerate(row):
+            # Empty cells leave the option as it is
+            if i != name_column and i < len(columns) and cell.strip():
+                options[columns[i]] = cell
+        name = row[name_column] if name_column < len(row) else None
+        yield reader.line_num, {'name': name, 'options': options}
+
+def _ndjson_records(stream):
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f'line {number}: {e}') from None
+        yield number, _flat_record(item)
+
+def _json_items(stream):
+    """Yield the items of a JSON array, or of the "hosts" array of an object, reading the stream in chunks"""
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    
+    def peek():
+        # Next non-space character, reading more input as needed; '' at the end of input
+        nonlocal buf, pos, eof
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf[pos:pos + 1]
+            buf = stream.read(READ_CHUNK_SIZE)
+            pos = 0
+            eof = not buf
+    
+    def value():
+        # Decode the value at pos; it is only complete once input follows it, as numbers may be cut
+        nonlocal buf, pos, eof
+        peek()
+        while True:
+            try:
+                result, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or eof:
+                    pos = end
+                    return result
+            except ValueError:
+                if eof or len(buf) - pos > JSON_RECORD_MAX:
+                    raise
+            more = stream.read(READ_CHUNK_SIZE)
+            eof = not more
+            buf = buf[pos:] + more
+            pos = 0
+    
+    if peek() == '{':
+        pos += 1
+        while True:
+            if peek() == '}':
+                return
+            key = value()
+            if peek() != ':':
+                raise ValueError('malformed JSON object')
+            pos += 1
+            if key == 'hosts':
+                break
+            value()
+            if peek() == ',':
+                pos += 1
+    if peek() != '[':
+        raise ValueError('JSON input must be an array of hosts or {"hosts": [...]}')
+    pos += 1
+    if peek() == ']':
+        return
+    while True:
+        yield value()
+        c = peek()
+        pos += 1
+        if c == ']':
+            return
+        if c != ',':
+            raise ValueError('malformed JSON array')
+
+def read_records(stream, fmt):
+    """Yield (row number, record) for each host in a text stream"""
+    if fmt == 'csv':
+        try:
+            yield from _csv_records(stream)
+        except csv.Error as e:
+            raise ValueError(f'CSV: {e}') from None
+    elif fmt == 'ndjson':
+        yield from _ndjson_records(stream)
+    elif fmt == 'json':
+        number = 0
+        try:
+            for number, item in enumerate(_json_items(stream), 1):
+                yield number, _flat_record(item)
+        except json.JSONDecodeError as e:
+            # Positions are relative to the read buffer, so report the item instead
+            raise ValueError(f'JSON: {e.msg} after item {number}') from None
+    else:
+        raise ValueError(f"format must be one of {', '.join(IMPORT_FORMATS)}")
+
+def checked_hosts(records, batch_size=IMPORT_BATCH_SIZE):
+    """Validate (row, record) pairs a batch at a time and yield (row, host) pairs
+
+    Once a row fails nothing more is yielded, but validation continues so
+    that BulkImportError, raised at the end of the input, lists every bad
+    row up to IMPORT_MAX_ERRORS.
+    """
+    errors = []
+    records = iter(records)
+    while len(errors) < IMPORT_MAX_ERRORS:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            break
+        valid, invalid = validate_hosts([record for _, record in batch], 'import')
+        errors.extend(f'row {batch[i][0]}: {message}' for i, message in invalid)
+        if not errors:
+            yield from zip((row for row, _ in batch), valid)
+    if errors:
+        raise BulkImportError(errors[:IMPORT_MAX_ERRORS])
+
+def spool_hosts(records):
+    """Validate (row, record) pairs and write them to a temporary file, one JSON line each
+
+    Returns the open file; read the hosts back with spooled_hosts(). Raises
+    BulkImportError as checked_hosts() does.
+    """
+    spool = tempfile.TemporaryFile('w+', encoding='utf-8')
+    try:
+        for row, host in checked_hosts(records):
+            spool.write(json.dumps([row, host], separators=(',', ':')) + '\n')
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+def spooled_hosts(spool):
+    """Yield the hosts of a spool file in input order"""
+    spool.seek(0)
+    for line in spool:
+        yield json.loads(line)[1]
+
+def spooled_rows_error(spool, issues):
+    """Return a BulkImportError reporting lint issues against the input rows that set the hosts they are on"""
+    names = {issue['host'] for issue in issues}
+    rows = {}
+    spool.seek(0)
+    for line in spool:
+        row, host = json.loads(line)
+        if host['name'] in names:
+            rows.setdefault(host['name'], []).append(row)
+    errors = []
+    for issue in issues:
+        found = rows.get(issue['host'])
+        if found:
+            where = f"row{'s' if len(found) > 1 else ''} {', '.join(str(row) for row in found)}"
+        else:
+            # Blocks the input did not name, such as a Match block it moved
+            where = f"config line {issue['line']}"
+        errors.append(f"{where}: {issue['message']}")
+    return BulkImportError(errors)
+
+def stream_hosts_csv(hosts, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield Host records as CSV with a name column and one column per option keyword"""
+    columns = {}
+    key_tuples = set()
+    for host in hosts:
+        # Hosts with the same keywords share one key tuple, so this is cheap
+        if host.keys not in key_tuples:
+            key_tuples.add(host.keys)
+            columns.update(dict.fromkeys(host.keys))
+    columns = list(columns)
+    
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(['name'] + columns)
+    for host in hosts:
+        options = host.options
+        writer.writerow([host.name] + [options.get(column, '') for column in columns])
+        if out.tell() >= chunk_size:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
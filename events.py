@@ -0,0 +1,185 @@
+"""Server-sent events: config changes pushed to connected clients as host deltas
+
+Each config with open streams has one channel holding the entry last
+published and a short history of change events. A change seen by the
+watcher, or by a stream's heartbeat, is diffed against that entry once and
+shared by every stream, which only waits on the channel's condition. A
+client resuming with Last-Event-ID (the version it has) is replayed the
+events it missed, or told to reload when they are no longer in the history.
+
+Under the threaded servers each open stream holds a worker thread, so
+set_stream_limit() caps them; run with gevent to serve hundreds of streams.
+"""
+from collections import deque
+import json
+import threading
+
+from store import load_config_cached, peek_config_cache
+
+# Change events kept per channel for clients that reconnect
+EVENT_HISTORY = 64
+# Changes touching more hosts than this are sent as a reload instead of a delta
+EVENT_DELTA_MAX = 1000
+# Seconds between keep-alive comments, each also checking the config for changes
+HEARTBEAT_INTERVAL = 15
+# Milliseconds a disconnected EventSource waits before reconnecting
+RECONNECT_DELAY = 3000
+
+_channels = {}
+_channels_lock = threading.Lock()
+_streams = {'open': 0, 'limit': None}
+
+def config_delta(old, new):
+    """Describe the change between two cache entries as positioned host deltas
+
+    Returns None when the change cannot be expressed that way, because
+    hosts were reordered or more than EVENT_DELTA_MAX hosts were touched.
+    """
+    old_hosts = old['hosts']
+    new_hosts = new['hosts']
+    # Unchanged blocks share their Host record with the previous parse; blocks with identical
+    # text share one record, so each position is chained to the next one holding it
+    by_identity = {}
+    next_same = [None] * len(old_hosts)
+    for j in range(len(old_hosts) - 1, -1, -1):
+        key = id(old_hosts[j])
+        next_same[j] = by_identity.get(key)
+        by_identity[key] = j
+    used = bytearray(len(old_hosts))
+    matches = []
+    for host in new_hosts:
+        j = by_identity.get(id(host))
+        if j is not None:
+            by_identity[id(host)] = next_same[j]
+            used[j] = 1
+        matches.append(j)
+    # The other hosts pair up by alias, in order, with old hosts that did not stay as they were
+    by_name = {}
+    for j, host in enumerate(old_hosts):
+        if not used[j]:
+            by_name.setdefault(host.name, []).append(j)
+    
+    added = []
+    modified = []
+    last = -1
+    for i, host in enumerate(new_hosts):
+        j = matches[i]
+        if j is None:
+            candidates = by_name.get(host.name)
+            if not candidates:
+                added.append({'index': i, 'host': host.to_dict()})
+                continue
+            j = candidates.pop(0)
+            used[j] = 1
+            if old_hosts[j] != host:
+                modified.append({'index': i, 'host': host.to_dict()})
+        # Hosts that are kept must stay in the same order for positions to line up
+        if j <= last:
+            return None
+        last = j
+        if len(added) + len(modified) > EVENT_DELTA_MAX:
+            return None
+    removed = [{'index': j, 'name': old_hosts[j].name} for j in range(len(old_hosts)) if not used[j]]
+    if len(added) + len(modified) + len(removed) > EVENT_DELTA_MAX:
+        return None
+    return {'added': added, 'removed': removed, 'modified': modified, 'total': len(new_hosts)}
+
+def _message(data):
+    return f"id: {data['version']}\nevent: config\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def _publish_locked(channel, entry):
+    previous = channel['entry']
+    if entry is None or entry['etag'] == previous['etag']:
+        return
+    delta = config_delta(previous, entry)
+    data = {'version': entry['etag'], 'previous': previous['etag']}
+    data.update(delta if delta is not None else {'reload': True})
+    channel['events'].append((previous['etag'], _message(data)))
+    channel['entry'] = entry
+    channel['seq'] += 1
+    channel['cond'].notify_all()
+
+def publish_change(path, expansion=None):
+    """Watch listener: publish the current entry of the config at path to its open streams"""
+    channel = _channels.get(path)
+    if channel is None:
+        return
+    entry = peek_config_cache(channel['tenant']) or load_config_cached(channel['tenant'])
+    with channel['cond']:
+        _publish_locked(channel, entry)
+
+def set_stream_limit(limit):
+    """Cap the number of open streams (None for no cap)"""
+    _streams['limit'] = limit
+
+def reserve_stream():
+    """Count a new stream in, or return False when the limit is reached"""
+    with _channels_lock:
+        if _streams['limit'] is not None and _streams['open'] >= _streams['limit']:
+            return False
+        _streams['open'] += 1
+        return True
+
+def release_stream():
+    with _channels_lock:
+        _streams['open'] -= 1
+
+def _subscribe(tenant):
+    entry = load_config_cached(tenant)
+    with _channels_lock:
+        channel = _channels.get(tenant['path'])
+        if channel is None:
+            channel = {'tenant': tenant, 'entry': entry, 'events': deque(maxlen=EVENT_HISTORY), 'seq': 0,
+                       'cond': threading.Condition(), 'clients': 0}
+            _channels[tenant['path']] = channel
+        channel['clients'] += 1
+    with channel['cond']:
+        _publish_locked(channel, entry)
+    return channel
+
+def _unsubscribe(channel):
+    with _channels_lock:
+        channel['clients'] -= 1
+        if channel['clients'] == 0 and _channels.get(channel['tenant']['path']) is channel:
+            del _channels[channel['tenant']['path']]
+
+def _missed_events(channel, version):
+    """Messages taking a client from version to the channel's current entry"""
+    current = channel['entry']['etag']
+    if version == current:
+        return []
+    events = list(channel['events'])
+    for i, (previous, _) in enumerate(events):
+        if previous == version:
+            return [message for _, message in events[i:]]
+    return [_message({'version': current, 'reload': True})]
+
+def stream_events(tenant, version=None):
+    """Yield SSE text for changes to a tenant's config after `version`, with keep-alive comments
+
+    Without a version the stream starts from the current config.
+    """
+    channel = _subscribe(tenant)
+    try:
+        with channel['cond']:
+            seq = channel['seq']
+            pending = _missed_events(channel, version) if version else []
+        yield f'retry: {RECONNECT_DELAY}\n\n' + ''.join(pending)
+        while True:
+            with channel['cond']:
+                if channel['seq'] == seq:
+                    channel['cond'].wait(HEARTBEAT_INTERVAL)
+                events = list(channel['events'])
+                count = min(channel['seq'] - seq, len(events))
+                pending = [message for _, message in events[len(events) - count:]] if count else []
+                if channel['seq'] - seq > len(events):
+                    pending = [_message({'version': channel['entry']['etag'], 'reload': True})]
+                seq = channel['seq']
+            if pending:
+                yield ''.join(pending)
+            else:
+                # Also covers changes the watcher missed, or a disabled watcher
+                publish_change(tenant['path'])
+                yield ': ping\n\n'
+    finally:
+        _unsubscribe(channel)
@@ -0,0 +1,363 @@
+"""Config version history: content-addressed block snapshots in SQLite
+
+Each saved state of a config is recorded as a version in a database next to
+it (.config.history). Blocks are stored once, keyed by the SHA-1 of their
+text, so a save only adds the blocks it changed. A version lists its block
+hashes in chunks that are content-addressed too, with chunk boundaries
+placed after blocks whose hash ends in CHUNK_AVERAGE_BLOCKS zero bits: an
+edit only changes the chunk around it, and a version of a 100,000-host
+config adds a few small rows instead of a full list of hashes.
+
+Diffs compare chunk hashes first, then block hashes in the chunks that
+differ, and parse only the blocks that changed. Rollback goes through the
+normal save path, so it is written atomically and recorded as a version of
+its own.
+"""
+from collections import Counter, OrderedDict
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from sshconfig import parse_block
+from store import match_owner
+
+# Set SSH_CONFIG_HISTORY=0 to stop recording versions
+HISTORY_ENABLED = os.environ.get('SSH_CONFIG_HISTORY', '1') != '0'
+# Versions kept per config; older ones are dropped with the blocks only they used
+HISTORY_MAX_VERSIONS = int(os.environ.get('SSH_CONFIG_HISTORY_MAX', '500'))
+# Versions recorded past the limit before pruning, so pruning runs once per batch
+HISTORY_PRUNE_SLACK = max(HISTORY_MAX_VERSIONS // 10, 1)
+
+# Average and largest number of blocks per chunk; the average must be a power of two
+CHUNK_AVERAGE_BLOCKS = 64
+CHUNK_MAX_BLOCKS = 1024
+DIGEST_SIZE = 20
+# Hashes per IN (...) query, below SQLite's bound-parameter limit
+QUERY_BATCH = 500
+# Configs whose newest version's block hashes are remembered, so their next save only hashes new blocks
+MEMO_CONFIGS = 16
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blocks (hash BLOB PRIMARY KEY, text BLOB NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS chunks (hash BLOB PRIMARY KEY, blocks BLOB NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    version TEXT NOT NULL,
+    created REAL NOT NULL,
+    source TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    hosts INTEGER NOT NULL,
+    chunks BLOB NOT NULL
+);
+'''
+
+_initialized = set()
+_initialized_lock = threading.Lock()
+# History path -> {'id': newest version id, 'digests': {block text: hash}} covering at least the blocks
+# of that version, least recently used first
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+def history_path(path):
+    """Database holding the version history of the config at path"""
+    return os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.history')
+
+def _connect(path, create=False):
+    """Open the history of a config, or return None if it has none and create is False"""
+    db_path = history_path(path)
+    if not create and not os.path.exists(db_path):
+        return None
+    if create and not os.path.exists(db_path):
+        # The history holds the config's content, so it gets the config's owner and permissions;
+        # SQLite gives its -wal and -shm files the owner of the database
+        fd = os.open(db_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            match_owner(fd, path, 0o600)
+        finally:
+            os.close(fd)
+        with _initialized_lock:
+            _initialized.discard(db_path)
+    db = sqlite3.connect(db_path, timeout=30)
+    with _initialized_lock:
+        if db_path not in _initialized:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            _initialized.add(db_path)
+    db.execute('PRAGMA synchronous=NORMAL')
+    return db
+
+def _digests(blob):
+    return [blob[i:i + DIGEST_SIZE] for i in range(0, len(blob), DIGEST_SIZE)]
+
+def _split_chunks(digests):
+    """Cut a version's block hashes into content-defined chunks"""
+    mask = CHUNK_AVERAGE_BLOCKS - 1
+    ends = [i + 1 for i, digest in enumerate(digests) if not digest[-1] & mask]
+    ends.append(len(digests))
+    chunks = []
+    start = 0
+    for end in ends:
+        while end - start > CHUNK_MAX_BLOCKS:
+            chunks.append(digests[start:start + CHUNK_MAX_BLOCKS])
+            start += CHUNK_MAX_BLOCKS
+        if end > start:
+            chunks.append(digests[start:end])
+            start = end
+    return chunks
+
+def _fetch(db, table, column, digests):
+    """Return {hash: column} for the given hashes of a table"""
+    digests = set(digests)
+    if len(digests) > QUERY_BATCH:
+        # Reading most of a table is faster as one scan than as lookups, as when rolling back
+        total = db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        if len(digests) * 4 >= total:
+            return {digest: value for digest, value in db.execute(f'SELECT hash, {column} FROM {table}')
+                    if digest in digests}
+    found = {}
+    digests = list(digests)
+    for i in range(0, len(digests), QUERY_BATCH):
+        batch = digests[i:i + QUERY_BATCH]
+        query = f"SELECT hash, {column} FROM {table} WHERE hash IN ({','.join('?' * len(batch))})"
+        found.update(db.execute(query, batch))
+    return found
+
+def _version_row(db, version_id):
+    row = db.execute('SELECT id, version, chunks FROM versions WHERE id = ?', (version_id,)).fetchone()
+    if row is None:
+        raise LookupError(f'No version {version_id} in the history')
+    return row
+
+def _chunk_blocks(db, chunk_digests):
+    """Block hashes of each of the given chunks, as {chunk hash: [block hashes]}"""
+    return {digest: _digests(blob) for digest, blob in _fetch(db, 'chunks', 'blocks', chunk_digests).items()}
+
+def _record(db, db_path, parsed, version, source):
+    texts = parsed['texts']
+    last = db.execute('SELECT id, version, chunks FROM versions ORDER BY id DESC LIMIT 1').fetchone()
+    if last is not None and last[1] == version:
+        return None
+    # Blocks of the newest version are stored already; only the others are hashed and stored
+    with _memo_lock:
+        memo = _memo.get(db_path)
+    new_blocks = {}
+    if memo is not None and last is not None and memo['id'] == last[0]:
+        known = memo['digests']
+        digests = list(map(known.get, texts))
+        for i in [i for i, digest in enumerate(digests) if digest is None]:
+            data = texts[i].encode('utf-8', 'surrogateescape')
+            digests[i] = known[texts[i]] = hashlib.sha1(data).digest()
+            new_blocks[digests[i]] = data
+    else:
+        # Nothing remembered, or another process saved since
+        memo = None
+        known = set()
+        if last is not None:
+            for blocks in _chunk_blocks(db, _digests(last[2])).values():
+                known.update(blocks)
+        digests = []
+        for text in texts:
+            data = text.encode('utf-8', 'surrogateescape')
+            digest = hashlib.sha1(data).digest()
+            if digest not in known:
+                new_blocks[digest] = data
+            digests.append(digest)
+    db.executemany('INSERT OR IGNORE INTO blocks VALUES (?, ?)', new_blocks.items())
+    
+    chunk_digests = []
+    new_chunks = []
+    for chunk in _split_chunks(digests):
+        blob = b''.join(chunk)
+        digest = hashlib.sha1(blob).digest()
+        chunk_digests.append(digest)
+        new_chunks.append((digest, blob))
+    db.executemany('INSERT OR IGNORE INTO chunks VALUES (?, ?)', new_chunks)
+    size = len(''.join(texts).encode('utf-8', 'surrogateescape'))
+    cursor = db.execute('INSERT INTO versions (version, created, source, size, hosts, chunks) VALUES (?, ?, ?, ?, ?, ?)',
+                        (version, time.time(), source, size, len(parsed['hosts']), b''.join(chunk_digests)))
+    # The remembered texts only grow by the new blocks, until old ones make up half of them
+    if memo is None or len(memo['digests']) > 2 * len(texts):
+        memo = {'digests': dict(zip(texts, digests))}
+    memo['id'] = cursor.lastrowid
+    with _memo_lock:
+        _memo[db_path] = memo
+        _memo.move_to_end(db_path)
+        while len(_memo) > MEMO_CONFIGS:
+            _memo.popitem(last=False)
+    return cursor.lastrowid
+
+def _prune(db, db_path):
+    """Drop versions past HISTORY_MAX_VERSIONS, then the chunks and blocks no kept version uses"""
+    count = db.execute('SELECT COUNT(*) FROM versions').fetchone()[0]
+    if count <= HISTORY_MAX_VERSIONS + HISTORY_PRUNE_SLACK:
+        return
+    # The remembered texts may include blocks deleted here
+    with _memo_lock:
+        _memo.pop(db_path, None)
+    db.execute('DELETE FROM versions WHERE id NOT IN (SELECT id FROM versions ORDER BY id DESC LIMIT ?)',
+               (HISTORY_MAX_VERSIONS,))
+    live_chunks = set()
+    for (blob,) in db.execute('SELECT chunks FROM versions'):
+        live_chunks.update(_digests(blob))
+    live_blocks = set()
+    dead_chunks = []
+    for digest, blob in db.execute('SELECT hash, blocks FROM chunks'):
+        if digest in live_chunks:
+            live_blocks.update(_digests(blob))
+        else:
+            dead_chunks.append((digest,))
+    db.executemany('DELETE FROM chunks WHERE hash = ?', dead_chunks)
+    dead_blocks = [(digest,) for (digest,) in db.execute('SELECT hash FROM blocks') if digest not in live_blocks]
+    db.executemany('DELETE FROM blocks WHERE hash = ?', dead_blocks)
+
+@contextmanager
+def _recording(path):
+    """Open a config's history for writing, in one transaction committed at the end of the block"""
+    db_path = history_path(path)
+    try:
+        with closing(_connect(path, create=True)) as db:
+            with db:
+                yield db, db_path
+    except BaseException:
+        # The remembered hashes may name blocks that were rolled back
+        with _memo_lock:
+            _memo.pop(db_path, None)
+        raise
+
+def record_version(path, parsed, version, source='save'):
+    """Record a parsed config state as the newest version; returns its id, or None if it is the newest already"""
+    with _recording(path) as (db, db_path):
+        version_id = _record(db, db_path, parsed, version, source)
+        if version_id is not None:
+            _prune(db, db_path)
+    return version_id
+
+def record_save(tenant, entry, previous, source):
+    """Post-write hook: record a save, and first the state it replaced if that was never recorded
+
+    The replaced state is missing from the history on the first save and
+    after the file was edited outside the app; it is recorded as 'external'.
+    """
+    with _recording(tenant['path']) as (db, db_path):
+        if previous is not None and previous['key'] is not None:
+            _record(db, db_path, previous['parsed'], previous['etag'], 'external')
+        if _record(db, db_path, entry['parsed'], entry['etag'], source) is not None:
+            _prune(db, db_path)
+
+def list_versions(path, limit=100, before=None):
+    """Versions of a config, newest first; before= pages back from a version id"""
+    db = _connect(path)
+    if db is None:
+        return []
+    with closing(db):
+        rows = db.execute('SELECT id, version, created, source, size, hosts FROM versions WHERE id < ? '
+                          'ORDER BY id DESC LIMIT ?', (before if before is not None else 2 ** 62, limit))
+        return [{'id': version_id, 'version': version, 'source': source, 'size': size, 'hosts': hosts,
+                 'created': datetime.fromtimestamp(created, timezone.utc).isoformat()}
+                for version_id, version, created, source, size, hosts in rows]
+
+def latest_version_id(path):
+    """Id of the newest recorded version, or None"""
+    db = _connect(path)
+    if db is None:
+        return None
+    with closing(db):
+        row = db.execute('SELECT MAX(id) FROM versions').fetchone()
+    return row[0]
+
+def version_content(path, version_id):
+    """Return (version, config text) of a recorded version; raises LookupError if there is none"""
+    db = _connect(path)
+    if db is None:
+        raise LookupError(f'No version {version_id} in the history')
+    with closing(db):
+        _, version, chunk_blob = _version_row(db, version_id)
+        chunk_digests = _digests(chunk_blob)
+        chunks = _chunk_blocks(db, chunk_digests)
+        digests = [digest for chunk in chunk_digests for digest in chunks[chunk]]
+        texts = _fetch(db, 'blocks', 'text', digests)
+    return version, b''.join(texts[digest] for digest in digests).decode('utf-8', 'surrogateescape')
+
+def _block_entries(texts, digests):
+    """Describe blocks as {'kind', 'name', 'options'}, the last value of an option winning as in /api/config"""
+    entries = []
+    for digest in digests:
+        node = parse_block(texts[digest].decode('utf-8', 'surrogateescape'))
+        options = {}
+        for _, _, keyword, value in node['directives']:
+            options[keyword] = value
+        entries.append({'kind': node['kind'], 'name': node['header'], 'options': options})
+    return entries
+
+def _only_in(digests, others):
+    """The digests not matched by one in others, in order, counting repeats"""
+    remaining = Counter(others)
+    result = []
+    for digest in digests:
+        if remaining[digest]:
+            remaining[digest] -= 1
+        else:
+            result.append(digest)
+    return result
+
+def diff_versions(path, from_id, to_id):
+    """Structural diff between two versions: the hosts and sections added, removed and modified
+
+    Blocks are paired by kind and Host/Match line, in order; modified ones
+    list each option that changed as {'from': old, 'to': new}, with None
+    where it is not set. Blocks whose text changed without changing any
+    option (comments, indentation) are not reported, nor are moves.
+    """
+    db = _connect(path)
+    if db is None:
+        raise LookupError(f'No version {from_id} in the history')
+    with closing(db):
+        old_row = _version_row(db, from_id)
+        new_row = _version_row(db, to_id)
+        old_chunks = _digests(old_row[2])
+        new_chunks = _digests(new_row[2])
+        # Chunks both versions share hold the same blocks; only the others are opened
+        old_only = _only_in(old_chunks, new_chunks)
+        new_only = _only_in(new_chunks, old_chunks)
+        chunks = _chunk_blocks(db, old_only + new_only)
+        old_blocks = [digest for chunk in old_only for digest in chunks[chunk]]
+        new_blocks = [digest for chunk in new_only for digest in chunks[chunk]]
+        removed_blocks = _only_in(old_blocks, new_blocks)
+        added_blocks = _only_in(new_blocks, old_blocks)
+        texts = _fetch(db, 'blocks', 'text', removed_blocks + added_blocks)
+    
+    removed = _block_entries(texts, removed_blocks)
+    pending = {}
+    for i, entry in enumerate(removed):
+        pending.setdefault((entry['kind'], entry['name']), []).append(i)
+    paired = set()
+    added = []
+    modified = []
+    for entry in _block_entries(texts, added_blocks):
+        candidates = pending.get((entry['kind'], entry['name']))
+        if not candidates:
+            added.append(entry)
+            continue
+        old = removed[candidates.pop(0)]
+        paired.add(id(old))
+        changes = {}
+        for keyword in {**old['options'], **entry['options']}:
+            before = old['options'].get(keyword)
+            after = entry['options'].get(keyword)
+            if before != after:
+                changes[keyword] = {'from': before, 'to': after}
+        if changes:
+            modified.append({'kind': entry['kind'], 'name': entry['name'], 'changes': changes})
+    removed = [entry for entry in removed if id(entry) not in paired]
+    return {
+        'from': {'id': old_row[0], 'version': old_row[1]},
+        'to': {'id': new_row[0], 'version': new_row[1]},
+        'added': added,
+        'removed': removed,
+        'modified': modified,
+        'blocks_compared': len(removed_blocks) + len(added_blocks),
+    }
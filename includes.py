@@ -0,0 +1,257 @@
+"""Include expansion with a per-file parse cache and a change watcher
+
+Every file reachable through Include directives is parsed once and cached
+under its (inode, mtime_ns, size); the expansion of a root config is rebuilt
+from those cached fragments, so a change to one fragment only re-parses that
+fragment. A background watcher keeps the cache warm by re-checking the files
+and the directories their Include globs point into, waking early on
+filesystem events when the optional watchdog package is installed.
+
+Includes are confined to the home of the config's owner: ~ stands for that
+home rather than the server's, and files outside it are not read, so one
+tenant's config cannot pull in another user's files.
+"""
+import glob
+import os
+import threading
+
+from sshconfig import CONFIG_ENCODING, parse_ssh_config_incremental
+
+# OpenSSH refuses to nest Include deeper than this
+MAX_INCLUDE_DEPTH = 16
+
+_fragments = {}
+_fragments_lock = threading.Lock()
+_expansions = {}
+_watcher_state = {'thread': None, 'wake': threading.Event(), 'roots': {}, 'observer': None, 'watched_dirs': set()}
+_watch_listeners = []
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def load_fragment(path):
+    """Return the cached parse of one config file, re-parsing it only when it changed"""
+    key = _stat_key(path)
+    with _fragments_lock:
+        fragment = _fragments.get(path)
+        if fragment is not None and fragment['key'] == key:
+            return fragment
+    
+    content = ""
+    if key is not None:
+        try:
+            with open(path, 'r', **CONFIG_ENCODING) as f:
+                st = os.fstat(f.fileno())
+                key = (st.st_ino, st.st_mtime_ns, st.st_size)
+                content = f.read()
+        except OSError:
+            key = None
+    parsed, diff = parse_ssh_config_incremental(content, fragment['parsed'] if fragment else None)
+    fragment = {'path': path, 'key': key, 'parsed': parsed, 'diff': diff}
+    with _fragments_lock:
+        _fragments[path] = fragment
+    return fragment
+
+def _expand_home(pattern, home):
+    if pattern == '~' or pattern.startswith('~/'):
+        return home + pattern[1:]
+    return os.path.expanduser(pattern)
+
+def _inside(path, home):
+    """True if path, with symlinks resolved, lies within the real path home"""
+    path = os.path.realpath(path)
+    return path == home or path.startswith(home.rstrip(os.sep) + os.sep)
+
+def resolve_include(pattern, base_dir, home):
+    """Expand one Include argument to (files it names within home, files it names outside home), sorted
+
+    home is the real path of the directory ~ stands for.
+    """
+    pattern = _expand_home(pattern, home)
+    if not os.path.isabs(pattern):
+        pattern = os.path.join(base_dir, pattern)
+    if glob.has_magic(pattern):
+        paths = sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+    else:
+        paths = [pattern] if os.path.isfile(pattern) else []
+    allowed, refused = [], []
+    for path in paths:
+        (allowed if _inside(path, home) else refused).append(path)
+    return allowed, refused
+
+def _watch_dir(pattern, base_dir, home):
+    """Directory whose listing decides what an Include argument matches"""
+    pattern = _expand_home(pattern, home)
+    if not os.path.isabs(pattern):
+        pattern = os.path.join(base_dir, pattern)
+    directory = os.path.dirname(pattern)
+    while glob.has_magic(directory):
+        directory = os.path.dirname(directory)
+    return directory
+
+def _section(path, node, context, directives, host):
+    kind, header = (node['kind'], node['header']) if node['kind'] != 'global' or context is None else context
+    return {'source': path, 'kind': kind, 'header': header, 'directives': directives, 'host': host}
+
+def _expand(path, fragment, base_dir, home, context, stack, files, sections, refused):
+    """Append the sections of one file, descending into its includes in place"""
+    parsed = fragment['parsed']
+    includes = []
+    for text in parsed['texts']:
+        node = parsed['blocks'][text]
+        directives = node['directives']
+        if not any(d[2] == 'include' for d in directives):
+            sections.append(_section(path, node, context, directives, node['host']))
+            continue
+        
+        host = node['host']
+        part = []
+        for directive in directives:
+            if directive[2] != 'include':
+                part.append(directive)
+                continue
+            sections.append(_section(path, node, context, part, host))
+            host = None
+            part = []
+            # Lines before the first Host in an included file belong to the enclosing block
+            inner_context = context if node['kind'] == 'global' else (node['kind'], node['header'])
+            for argument in directive[3].split():
+                includes.append(argument)
+                children, outside = resolve_include(argument, base_dir, home)
+                refused.extend(outside)
+                for child in children:
+                    if child in stack:
+                        continue
+                    if len(stack) >= MAX_INCLUDE_DEPTH:
+                        raise ValueError(f"Include nested too deeply at {child}")
+                    stack.append(child)
+                    _expand(child, load_fragment(child), base_dir, home, inner_context, stack, files, sections, refused)
+                    stack.pop()
+        sections.append(_section(path, node, context, part, host))
+    files[path] = {'key': fragment['key'], 'includes': includes}
+
+def expand_config(root_path, home, root_fragment=None):
+    """Return the Include-expanded view of a config, reusing it while no file involved changed
+
+    The result holds `sections` (every Host/Match/global section in the
+    order OpenSSH reads them, with its source file, its directive tuples and,
+    for the section that opens a Host block, the host dict), `files` (the
+    include graph: each file's stat key and Include arguments) and `refused`
+    (included files left out because they lie outside home). Relative
+    includes resolve against the root config's directory, as they do for
+    ~/.ssh/config, and ~ stands for home.
+    """
+    root_fragment = root_fragment or load_fragment(root_path)
+    base_dir = os.path.dirname(root_path)
+    expansion = _expansions.get(root_path)
+    if expansion is not None and expansion['root_key'] == root_fragment['key'] and _expansion_current(root_path, expansion):
+        return expansion
+    
+    home = os.path.realpath(home)
+    files = {}
+    sections = []
+    refused = []
+    _expand(root_path, root_fragment, base_dir, home, None, [root_path], files, sections, refused)
+    expansion = {
+        'root_key': root_fragment['key'],
+        'files': files,
+        'dirs': {d: _stat_key(d) for path, info in files.items() for d in (_watch_dir(a, base_dir, home) for a in info['includes'])},
+        'sections': sections,
+        'refused': sorted(set(refused)),
+    }
+    _expansions[root_path] = expansion
+    return expansion
+
+def _expansion_current(root_path, expansion):
+    """Check that no included file and no globbed directory changed since the expansion"""
+    for path, info in expansion['files'].items():
+        if path != root_path and _stat_key(path) != info['key']:
+            return False
+    return all(_stat_key(directory) == key for directory, key in expansion['dirs'].items())
+
+def forget_config(root_path):
+    """Drop the cached expansion of a root config, and its fragments no other expansion uses, and stop watching it"""
+    _watcher_state['roots'].pop(root_path, None)
+    expansion = _expansions.pop(root_path, None)
+    if expansion is None:
+        return
+    in_use = {path for other in list(_expansions.values()) for path in other['files']}
+    with _fragments_lock:
+        for path in expansion['files']:
+            if path not in in_use:
+                _fragments.pop(path, None)
+
+def add_watch_listener(callback):
+    """Register callback(root_path, expansion) to run when the watcher sees a change"""
+    _watch_listeners.append(callback)
+
+def watch_config(root_path, home, load_root):
+    """Keep root_path's parse and expansion warm; load_root() returns its current fragment
+
+    home is passed on to expand_config(). A root that is already watched is
+    left as it is, so this is cheap to call on every request; only a new
+    root makes the watcher check now.
+    """
+    watch = (home, load_root)
+    if _watcher_state['roots'].setdefault(root_path, watch) is not watch:
+        return
+    _watcher_state['wake'].set()
+
+def wake_watcher():
+    """Make the watcher check its configs now rather than at its next poll"""
+    _watcher_state['wake'].set()
+
+def start_watcher(interval):
+    """Start the background watcher thread once; polls every `interval` seconds"""
+    if _watcher_state['thread'] is not None:
+        return
+    thread = threading.Thread(target=_watch_loop, args=(interval,), name='ssh-config-watcher', daemon=True)
+    _watcher_state['thread'] = thread
+    thread.start()
+
+def _watch_loop(interval):
+    wake = _watcher_state['wake']
+    while True:
+        wake.wait(interval)
+        wake.clear()
+        for root_path, (home, load_root) in list(_watcher_state['roots'].items()):
+            try:
+                previous = _expansions.get(root_path)
+                expansion = expand_config(root_path, home, load_root())
+            except Exception:
+                continue
+            if expansion is not previous:
+                _update_observer(expansion)
+                for callback in _watch_listeners:
+                    try:
+                        callback(root_path, expansion)
+                    except Exception:
+                        pass
+
+def _update_observer(expansion):
+    """Point the optional watchdog observer at every directory the expansion depends on"""
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return
+    dirs = {os.path.dirname(path) for path in expansion['files']} | set(expansion['dirs'])
+    dirs = {d for d in dirs if os.path.isdir(d)}
+    if dirs <= _watcher_state['watched_dirs']:
+        return
+    
+    class WakeHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            _watcher_state['wake'].set()
+    
+    if _watcher_state['observer'] is None:
+        _watcher_state['observer'] = Observer()
+        _watcher_state['observer'].daemon = True
+        _watcher_state['observer'].start()
+    for directory in dirs - _watcher_state['watched_dirs']:
+        _watcher_state['observer'].schedule(WakeHandler(), directory, recursive=False)
+    _watcher_state['watched_dirs'] |= dirs
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""Config lint: one pass over a parsed config, backed by hashed indexes
+
+Every directive is checked for an unknown keyword (with the keyword it is
+probably a misspelling of), a missing value, a bad Port, bad
+LocalForward/RemoteForward/DynamicForward syntax and an IdentityFile that
+does not exist. Each distinct keyword, port and path is only looked at
+once. Host patterns are checked against each other: a pattern that an
+earlier Host line already lists is a duplicate, and an option set for an
+alias that global options, an earlier block for the same alias or a
+matching wildcard already set is shadowed, since ssh keeps the first value
+it obtains. Earlier matching sections are found with the resolver's
+compiled matcher, so the pass stays linear in the size of the config.
+
+Issues are dicts of line, severity ('error' for lines ssh rejects,
+'warning' otherwise), code, message and host.
+"""
+from bisect import bisect_left
+import difflib
+import fnmatch
+import os
+import socket
+
+from resolver import compile_matcher, match_host_sections
+from sshconfig import MULTI_VALUE_OPTIONS, OPENSSH_KEYWORDS
+
+# Number of arguments each forwarding option takes
+FORWARD_OPTIONS = {'localforward': (2, 2), 'remoteforward': (1, 2), 'dynamicforward': (1, 1)}
+# Keywords ssh still reads but ignores, as deprecated or unsupported, and Apple's UseKeychain; these only warn
+OBSOLETE_KEYWORDS = frozenset({
+    'afstokenpassing',
+    'cipher',
+    'compressionlevel',
+    'fallbacktorsh',
+    'kerberosauthentication',
+    'kerberostgtpassing',
+    'protocol',
+    'rhostsrsaauthentication',
+    'rsaauthentication',
+    'usekeychain',
+    'useprivilegedport',
+    'useroaming',
+    'usersh',
+})
+# How close an unknown keyword must be to a known one to be suggested
+SUGGESTION_CUTOFF = 0.75
+_keyword_list = sorted(OPENSSH_KEYWORDS)
+
+class LintError(ValueError):
+    """A save was rejected by lint; issues lists the errors it would introduce"""
+    
+    def __init__(self, issues):
+        more = f" (and {len(issues) - 1} more)" if len(issues) > 1 else ''
+        super().__init__(f"line {issues[0]['line']}: {issues[0]['message']}{more}")
+        self.issues = issues
+
+def config_home(path):
+    """Return the directory ~ stands for in a config: the parent of its .ssh directory
+
+    A config kept elsewhere, such as /srv/ssh/{tenant}/config, gets its own
+    directory, never the home of the user running the app.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if os.path.basename(directory) == '.ssh':
+        return os.path.dirname(directory)
+    return directory
+
+def _new_state(home, check_files):
+    return {'home': home, 'check_files': check_files, 'ignore': [], 'suggestions': {}, 'ports': {}, 'paths': {}}
+
+def _issue(line, severity, code, message, host):
+    return {'line': line, 'severity': severity, 'code': code, 'message': message, 'host': host}
+
+def _valid_port(state, text, allow_zero=False):
+    """Port numbers or service names, as OpenSSH's a2port accepts them"""
+    if text.isdigit():
+        return (0 if allow_zero else 1) <= int(text) <= 65535
+    valid = state['ports'].get(text)
+    if valid is None:
+        try:
+            socket.getservbyname(text, 'tcp')
+            valid = True
+        except OSError:
+            valid = False
+        state['ports'][text] = valid
+    return valid
+
+def _split_host_port(spec):
+    """Split host:port, [address]:port or host/port; the host is '' when there is none"""
+    if spec.startswith('['):
+        end = spec.find(']')
+        if end < 0 or spec[end + 1:end + 2] != ':':
+            return None, None
+        return spec[1:end], spec[end + 2:]
+    host, sep, port = spec.rpartition(':')
+    if not sep:
+        host, sep, port = spec.rpartition('/')
+    return host, port
+
+def _forward_error(state, keyword, value):
+    args = value.split()
+    low, high = FORWARD_OPTIONS[keyword]
+    if not low <= len(args) <= high:
+        return 'expects [bind_address:]port' + (' host:hostport' if high == 2 else '')
+    # Arguments starting with / or ~ are Unix socket paths
+    if args[0][0] not in '/~':
+        _, port = _split_host_port(args[0])
+        if port is None or not _valid_port(state, port, allow_zero=keyword == 'remoteforward'):
+            return f"has a bad listen port in {args[0]!r}"
+    if len(args) == 2 and args[1][0] not in '/~':
+        host, port = _split_host_port(args[1])
+        if not host or port is None or not _valid_port(state, port):
+            return f"has a bad destination {args[1]!r}, expected host:hostport"
+    return None
+
+def _identity_missing(state, value):
+    """True if an IdentityFile that can be checked here does not exist"""
+    path = value[1:-1] if len(value) > 1 and value[0] == value[-1] == '"' else value
+    if path.lower() == 'none':
+        return False
+    home = state['home']
+    path = path.replace('%d', home).replace('%%', '\0')
+    # Other tokens and environment variables depend on the connection
+    if '%' in path or '${' in path:
+        return False
+    path = path.replace('\0', '%')
+    if path == '~' or path.startswith('~/'):
+        path = home + path[1:]
+    if not os.path.isabs(path):
+        return False
+    missing = state['paths'].get(path)
+    if missing is None:
+        missing = state['paths'][path] = not os.path.exists(path)
+    return missing
+
+def _add_ignored(state, value):
+    state['ignore'].extend(pattern.lower() for pattern in value.split(','))
+
+def _check_block(state, node, text, line, issues):
+    """Check each directive of a block on its own; returns (keyword, line, as written) for each"""
+    host = node['header'] if node['kind'] == 'host' else None
+    if node['kind'] != 'global' and not (node['header'] or '').strip():
+        header_line = line + text.count('\n', 0, node['header_offset'])
+        issues.append(_issue(header_line, 'error', 'missing-value', f"{node['kind'].capitalize()} needs an argument", host))
+    checked = []
+    pos = 0
+    for start, end, keyword, value in node['directives']:
+        line += text.count('\n', pos, start)
+        pos = start
+        written = text[start:end].split(None, 1)[0].split('=', 1)[0]
+        checked.append((keyword, line, written))
+        if keyword not in OPENSSH_KEYWORDS:
+            if any(fnmatch.fnmatchcase(keyword, pattern) for pattern in state['ignore']):
+                continue
+            if keyword in OBSOLETE_KEYWORDS:
+                issues.append(_issue(line, 'warning', 'obsolete-keyword', f"{written} is deprecated or unsupported, ssh ignores it", host))
+                continue
+            suggestion = state['suggestions'].get(keyword)
+            if suggestion is None:
+                matches = difflib.get_close_matches(keyword, _keyword_list, n=1, cutoff=SUGGESTION_CUTOFF)
+                suggestion = state['suggestions'][keyword] = matches[0] if matches else ''
+            hint = f", did you mean {suggestion}?" if suggestion else ''
+            # ssh refuses to start on a keyword it does not know unless IgnoreUnknown lists it
+            issues.append(_issue(line, 'error', 'unknown-keyword', f"Unknown keyword {written}{hint}", host))
+            continue
+        if not value:
+            issues.append(_issue(line, 'error', 'missing-value', f"{written} needs a value", host))
+        elif keyword == 'ignoreunknown':
+            _add_ignored(state, value)
+        elif keyword == 'port':
+            if not _valid_port(state, value):
+                issues.append(_issue(line, 'error', 'bad-port', f"{written} {value!r} is not a port number", host))
+        elif keyword in FORWARD_OPTIONS:
+            error = _forward_error(state, keyword, value)
+            if error:
+                issues.append(_issue(line, 'error', 'bad-forward', f"{written} {error}", host))
+        elif keyword == 'identityfile' and state['check_files'] and _identity_missing(state, value):
+            issues.append(_issue(line, 'warning', 'missing-identity-file', f"{written} {value} does not exist", host))
+    return checked
+
+def lint_config(parsed, home=None, check_files=True):
+    """Lint a parsed config; returns its issues in line order
+
+    home is the directory ~ stands for in IdentityFile paths (the current
+    user's home by default); check_files=False skips the IdentityFile check.
+    """
+    state = _new_state(home or os.path.expanduser('~'), check_files)
+    texts = parsed['texts']
+    nodes = [parsed['blocks'][text] for text in texts]
+    matcher = compile_matcher([{'kind': node['kind'], 'header': node['header'], 'directives': node['directives'],
+                                'source': None} for node in nodes])
+    # Options set before the first Host or Match line apply to every host
+    global_keys = {d[2] for d in nodes[0]['directives']} if nodes and nodes[0]['kind'] == 'global' else set()
+    block_lines = []
+    seen = {}
+    issues = []
+    line = 1
+    for i, (text, node) in enumerate(zip(texts, nodes)):
+        # Line of the Host or Match line, after any comments that open the block
+        header_line = line + text.count('\n', 0, node['header_offset'] or 0)
+        block_lines.append(header_line)
+        block_issues = []
+        checked = _check_block(state, node, text, line, block_issues)
+        if node['kind'] == 'host':
+            first = {}
+            for keyword, directive_line, written in checked:
+                if keyword not in MULTI_VALUE_OPTIONS and keyword not in first:
+                    first[keyword] = (directive_line, written)
+            for pattern in (node['header'] or '').split():
+                if pattern in seen:
+                    block_issues.append(_issue(header_line, 'warning', 'duplicate-host',
+                                               f"Host {pattern} is already listed on line {seen[pattern]}", pattern))
+                else:
+                    seen[pattern] = header_line
+                if pattern[0] == '!' or '*' in pattern or '?' in pattern or not first:
+                    continue
+                indices = match_host_sections(matcher, pattern)
+                earlier = indices[:bisect_left(indices, i)]
+                for keyword, (directive_line, written) in first.items():
+                    if keyword in global_keys:
+                        where = 'the global options at the top'
+                    else:
+                        k = next((k for k in earlier if nodes[k]['host'].get(keyword) is not None), None)
+                        if k is None:
+                            continue
+                        where = f"Host {nodes[k]['header']} on line {block_lines[k]}"
+                    block_issues.append(_issue(directive_line, 'warning', 'shadowed-option',
+                                               f"{written} is ignored for {pattern}: {where} set it first", pattern))
+        block_issues.sort(key=lambda issue: issue['line'])
+        issues.extend(block_issues)
+        line += text.count('\n')
+    return issues
+
+def lint_changes(parsed, previous=None):
+    """Check the directives of the blocks that differ from a previous parse; returns their issues
+
+    Only the checks that look at one block at a time run, and files are not
+    checked, so this costs time in proportion to the change. IgnoreUnknown
+    lines in unchanged blocks still count for the blocks after them.
+    """
+    state = _new_state(os.path.expanduser('~'), False)
+    old_blocks = previous['blocks'] if previous else {}
+    issues = []
+    line = 1
+    for text in parsed['texts']:
+        if text not in old_blocks:
+            _check_block(state, parsed['blocks'][text], text, line, issues)
+        else:
+            for directive in parsed['blocks'][text]['directives']:
+                if directive[2] == 'ignoreunknown':
+                    _add_ignored(state, directive[3])
+        line += text.count('\n')
+    return issues
+
+def lint_pre_save(tenant, entry, previous):
+    """Pre-save hook: reject a save that introduces errors, leaving errors already in the file alone"""
+    errors = [issue for issue in lint_changes(entry['parsed'], previous['parsed'] if previous else None)
+              if issue['severity'] == 'error']
+    if errors:
+        raise LintError(errors)
@@ -0,0 +1,240 @@
+"""Request and hot-path metrics in Prometheus text format, and an opt-in sampling profiler
+
+timed() records how long each stage of serving or saving a config takes
+(read, parse, generate, json, write) in a histogram, and in the timings of
+the request being served. instrument() wraps the WSGI app to time each
+request by endpoint, count the bytes it received and sent, and report its
+stage timings and cache result in a Server-Timing header. Counts are per
+process; with several workers each one reports its own.
+
+When SSH_CONFIG_PROFILE_DIR is set, a request with ?profile=1 or an
+X-Profile: 1 header (or a random SSH_CONFIG_PROFILE_RATE share of all
+requests) has its thread's stack sampled every PROFILE_INTERVAL seconds
+until its response ends. The samples are written to that directory as
+collapsed stacks, the input format of flamegraph.pl and speedscope, and
+the file name is returned in an X-Profile-Dump header. Sampling reads
+other threads' frames, so it does not work under --gevent.
+"""
+from collections import Counter
+from contextlib import contextmanager
+import contextvars
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+
+from werkzeug.wsgi import ClosingIterator
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Directory for profile dumps; unset disables profiling
+PROFILE_DIR = os.environ.get('SSH_CONFIG_PROFILE_DIR')
+# Share of requests profiled without asking, from 0 to 1
+PROFILE_RATE = float(os.environ.get('SSH_CONFIG_PROFILE_RATE', '0'))
+PROFILE_INTERVAL = 0.005
+
+# WSGI environ key under which the app records the endpoint that served a request
+ENDPOINT_KEY = 'ssh_config.endpoint'
+
+# Type and help text of each metric kept here
+METRICS = {
+    'ssh_config_stage_seconds': ('histogram', 'Time spent reading, parsing, generating, JSON-encoding and writing configs'),
+    'ssh_config_http_request_seconds': ('histogram', 'Request time by endpoint, until the response body is sent'),
+    'ssh_config_http_requests_total': ('counter', 'Requests by endpoint and status'),
+    'ssh_config_http_received_bytes_total': ('counter', 'Request body bytes received by endpoint, from Content-Length'),
+    'ssh_config_http_sent_bytes_total': ('counter', 'Response body bytes sent by endpoint'),
+    'ssh_config_cache_requests_total': ('counter', 'Parsed config cache lookups by result'),
+    'ssh_config_read_bytes_total': ('counter', 'Config bytes read from disk'),
+    'ssh_config_profiles_total': ('counter', 'Requests profiled'),
+}
+
+_metrics_lock = threading.Lock()
+# (name, labels) -> [count per bucket..., count, sum] for histograms, or a value for counters
+_histograms = {}
+_counters = {}
+# Stage timings and cache result of the request being served, if any
+_current = contextvars.ContextVar('ssh_config_request', default=None)
+_profile_ids = itertools.count(1)
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def observe(name, seconds, **labels):
+    """Add an observation to a histogram"""
+    key = (name, _labels(labels))
+    with _metrics_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        histogram[-2] += 1
+        histogram[-1] += seconds
+
+def inc(name, amount=1, **labels):
+    """Add to a counter"""
+    key = (name, _labels(labels))
+    with _metrics_lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe_stage(stage, seconds):
+    """Record the time a stage took, for the metrics and for the current request"""
+    observe('ssh_config_stage_seconds', seconds, stage=stage)
+    current = _current.get()
+    if current is not None:
+        current['stages'][stage] = current['stages'].get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage):
+    """Time the body of a with statement as a stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+def count_cache(hit):
+    """Count a parsed config cache lookup; a request that missed at least once reports a miss"""
+    inc('ssh_config_cache_requests_total', result='hit' if hit else 'miss')
+    current = _current.get()
+    if current is not None and current['cache'] != 'miss':
+        current['cache'] = 'hit' if hit else 'miss'
+
+def count_read(size):
+    inc('ssh_config_read_bytes_total', size)
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+def render_metrics(extra=()):
+    """Return every metric in Prometheus text format; extra adds (name, type, help, value) samples"""
+    with _metrics_lock:
+        histograms = {key: list(value) for key, value in _histograms.items()}
+        counters = dict(_counters)
+    lines = []
+    for name, (kind, text) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value in (histograms if kind == 'histogram' else counters).items()
+                        if metric == name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", repr(bound))])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value[-2]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value[-1]}')
+    for name, kind, text, value in extra:
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+def server_timing(current, total):
+    """Server-Timing header value for a request's stage timings, cache result and time to headers"""
+    parts = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in current['stages'].items()]
+    if current['cache'] is not None:
+        parts.append(f'cache;desc={current["cache"]}')
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+def _wants_profile(environ):
+    if PROFILE_DIR is None:
+        return False
+    if environ.get('HTTP_X_PROFILE') == '1' or parse_qs(environ.get('QUERY_STRING', '')).get('profile') == ['1']:
+        return True
+    return PROFILE_RATE > 0 and random.random() < PROFILE_RATE
+
+def _sample(thread_id, profile):
+    while not profile['stop'].wait(PROFILE_INTERVAL):
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        profile['stacks'][';'.join(reversed(stack))] += 1
+
+def start_profile(environ):
+    """Start sampling the calling thread's stack for a request; returns the profile"""
+    path = re.sub(r'[^A-Za-z0-9]+', '_', environ.get('PATH_INFO', '')).strip('_') or 'index'
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(_profile_ids)}-{path}.folded"
+    profile = {'name': name, 'stacks': Counter(), 'stop': threading.Event()}
+    profile['thread'] = threading.Thread(target=_sample, args=(threading.get_ident(), profile), daemon=True)
+    profile['thread'].start()
+    return profile
+
+def finish_profile(profile):
+    """Stop sampling and write the collapsed stacks, most frequent first"""
+    profile['stop'].set()
+    profile['thread'].join()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, profile['name']), 'w', encoding='utf-8') as f:
+        for stack, count in profile['stacks'].most_common():
+            f.write(f'{stack} {count}\n')
+    inc('ssh_config_profiles_total')
+
+def instrument(wsgi_app):
+    """Wrap a WSGI app to record request metrics and Server-Timing, and profile requests that ask for it"""
+    
+    def app(environ, start_response):
+        started = time.perf_counter()
+        current = {'stages': {}, 'cache': None}
+        _current.set(current)
+        profile = start_profile(environ) if _wants_profile(environ) else None
+        sent = [0]
+        status = ['500']
+        
+        def timed_start_response(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            headers.append(('Server-Timing', server_timing(current, time.perf_counter() - started)))
+            if profile is not None:
+                headers.append(('X-Profile-Dump', profile['name']))
+            return start_response(status_line, headers, exc_info)
+        
+        def counted(body):
+            for chunk in body:
+                sent[0] += len(chunk)
+                yield chunk
+        
+        def finish():
+            _current.set(None)
+            endpoint = environ.get(ENDPOINT_KEY) or 'unmatched'
+            observe('ssh_config_http_request_seconds', time.perf_counter() - started, endpoint=endpoint)
+            inc('ssh_config_http_requests_total', endpoint=endpoint, status=status[0])
+            inc('ssh_config_http_sent_bytes_total', sent[0], endpoint=endpoint)
+            received = environ.get('CONTENT_LENGTH')
+            if received and received.isdigit():
+                inc('ssh_config_http_received_bytes_total', int(received), endpoint=endpoint)
+            if profile is not None:
+                finish_profile(profile)
+        
+        try:
+            body = wsgi_app(environ, timed_start_response)
+        except BaseException:
+            finish()
+            raise
+        callbacks = [getattr(body, 'close', None), finish]
+        return ClosingIterator(counted(body), [callback for callback in callbacks if callback is not None])
+    
+    return app
@@ -0,0 +1,194 @@
+"""Effective-config resolution, the equivalent of `ssh -G <host>`
+
+Host patterns from every section of an Include-expanded config are compiled
+once: literal aliases go into a hash table and wildcard patterns into a glob
+trie that is walked once per target, so a lookup costs about the length of
+the hostname rather than the number of hosts. Sections then apply in file
+order with first-obtained-value-wins, as OpenSSH does.
+"""
+import getpass
+import re
+import shlex
+
+from sshconfig import MULTI_VALUE_OPTIONS
+
+def _glob_regex(pattern):
+    """Compile an OpenSSH pattern, where only * and ? are special"""
+    return re.compile(''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in pattern), re.DOTALL)
+
+def _new_node():
+    return {'next': {}, 'any': None, 'star': None, 'loop': False, 'ends': []}
+
+def _closure(states):
+    # A '*' may match nothing, so its node is reachable without consuming a character
+    stack = list(states)
+    result = set(map(id, states))
+    nodes = list(states)
+    while stack:
+        node = stack.pop()
+        star = node['star']
+        if star is not None and id(star) not in result:
+            result.add(id(star))
+            nodes.append(star)
+            stack.append(star)
+    return nodes
+
+def compile_matcher(sections):
+    """Compile the Host patterns of expanded config sections into a matcher
+
+    Sections without a Host condition (global and Match sections) are kept
+    aside and evaluated on every lookup.
+    """
+    literals = {}
+    root = _new_node()
+    negated = {}
+    always = []
+    criteria = {}
+    for index, section in enumerate(sections):
+        if section['kind'] != 'host':
+            always.append(index)
+            if section['kind'] == 'match':
+                criteria[index] = compile_match(section['header'])
+            continue
+        # ssh matches Host patterns case-sensitively, so they are kept as written
+        for pattern in (section['header'] or '').split():
+            if pattern.startswith('!'):
+                negated.setdefault(index, []).append(_glob_regex(pattern[1:]))
+            elif '*' not in pattern and '?' not in pattern:
+                literals.setdefault(pattern, []).append(index)
+            else:
+                node = root
+                for c in pattern:
+                    if c == '*':
+                        if node['star'] is None:
+                            node['star'] = _new_node()
+                            node['star']['loop'] = True
+                        node = node['star']
+                    elif c == '?':
+                        if node['any'] is None:
+                            node['any'] = _new_node()
+                        node = node['any']
+                    else:
+                        node = node['next'].setdefault(c, _new_node())
+                node['ends'].append(index)
+    return {'sections': sections, 'literals': literals, 'trie': root, 'negated': negated, 'always': always, 'criteria': criteria}
+
+def match_host_sections(matcher, target):
+    """Return the indices of the Host sections whose patterns match target, in file order"""
+    candidates = set(matcher['literals'].get(target, ()))
+    states = _closure([matcher['trie']])
+    for c in target:
+        step = []
+        for node in states:
+            if node['loop']:
+                step.append(node)
+            child = node['next'].get(c)
+            if child is not None:
+                step.append(child)
+            if node['any'] is not None:
+                step.append(node['any'])
+        if not step:
+            break
+        states = _closure(step)
+    else:
+        for node in states:
+            candidates.update(node['ends'])
+    
+    negated = matcher['negated']
+    return sorted(i for i in candidates if not any(regex.fullmatch(target) for regex in negated.get(i, ())))
+
+def _compile_pattern_list(patterns):
+    return [(p.startswith('!'), _glob_regex(p[1:] if p.startswith('!') else p)) for p in patterns.split(',')]
+
+def _match_pattern_list(value, compiled):
+    """OpenSSH match_pattern_list: any positive pattern matches and no negated one does"""
+    matched = False
+    for negated, regex in compiled:
+        if regex.fullmatch(value):
+            if negated:
+                return False
+            matched = True
+    return matched
+
+def compile_match(criteria):
+    """Parse a Match line into (negate, criterion, argument, compiled patterns) tuples, or None if malformed"""
+    try:
+        tokens = shlex.split(criteria or '')
+    except ValueError:
+        tokens = (criteria or '').split()
+    compiled = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        negate = token.startswith('!')
+        name = token[1:].lower() if negate else token.lower()
+        i += 1
+        if name in ('all', 'canonical', 'final'):
+            compiled.append((negate, name, None, None))
+            continue
+        if i >= len(tokens):
+            return None
+        compiled.append((negate, name, tokens[i], _compile_pattern_list(tokens[i])))
+        i += 1
+    return compiled
+
+def _expand_hostname(hostname, target):
+    """Substitute %h in a HostName value as ssh does"""
+    return hostname.replace('%h', target).replace('%%', '%') if '%' in hostname else hostname
+
+def _match_criteria(criteria, target, options, unevaluated):
+    """Evaluate a compiled Match line; criteria that cannot be checked here count as not matching"""
+    if criteria is None:
+        return False
+    for negate, name, argument, patterns in criteria:
+        if name == 'all':
+            result = True
+        elif name in ('canonical', 'final'):
+            result = False
+        elif name == 'host':
+            # Once a HostName is set, ssh matches `host` against it rather than the name typed
+            result = _match_pattern_list(_expand_hostname(options.get('hostname', target), target), patterns)
+        elif name == 'originalhost':
+            result = _match_pattern_list(target, patterns)
+        elif name == 'user':
+            result = _match_pattern_list(options.get('user') or getpass.getuser(), patterns)
+        elif name == 'localuser':
+            result = _match_pattern_list(getpass.getuser(), patterns)
+        elif name == 'tagged':
+            result = _match_pattern_list(options.get('tag') or '', patterns)
+        else:
+            # exec, localnetwork and anything newer need the client side
+            unevaluated.append(f"{name} {argument}")
+            result = False
+        if result == negate:
+            return False
+    return True
+
+def resolve_host(matcher, target):
+    """Compute the effective options for target the way `ssh -G` would
+
+    Returns {'host', 'options', 'sections', 'unevaluated'}: options map
+    lowercase keywords to a value (or a list for options that accumulate),
+    sections lists the sections that applied, and unevaluated lists Match
+    criteria such as exec that were treated as not matching.
+    """
+    sections = matcher['sections']
+    indices = sorted(matcher['always'] + match_host_sections(matcher, target))
+    options = {}
+    applied = []
+    unevaluated = []
+    for index in indices:
+        section = sections[index]
+        if section['kind'] == 'match' and not _match_criteria(matcher['criteria'][index], target, options, unevaluated):
+            continue
+        if section['directives']:
+            applied.append({'source': section['source'], 'kind': section['kind'], 'header': section['header']})
+        for _, _, keyword, value in section['directives']:
+            if keyword in MULTI_VALUE_OPTIONS:
+                options.setdefault(keyword, []).append(value)
+            elif keyword not in options:
+                options[keyword] = value
+    
+    options['hostname'] = _expand_hostname(options.get('hostname', target), target)
+    options.setdefault('port', '22')
+    return {'host': target, 'options': options, 'sections': applied, 'unevaluated': unevaluated}
\ No newline at end of file
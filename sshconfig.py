@@ -0,0 +1,635 @@
+"""SSH config document model: parsing, generation and lossless editing
+
+A config is split into blocks, each starting at a Host or Match line (the
+first block holds whatever comes before them). Blocks keep their original
+text, so joining them reproduces the file byte for byte, and edits only
+re-serialize the lines they touch.
+"""
+import re
+import sys
+
+# Configs are read and written without newline translation, and bytes that are
+# not valid UTF-8 survive as surrogates, so an unedited file round-trips exactly
+CONFIG_ENCODING = {'encoding': 'utf-8', 'errors': 'surrogateescape', 'newline': ''}
+
+# Keywords documented in ssh_config(5), lowercased; parsed keywords are interned against this table
+OPENSSH_KEYWORDS = frozenset('''
+    addkeystoagent addressfamily batchmode bindaddress bindinterface canonicaldomains
+    canonicalizefallbacklocal canonicalizehostname canonicalizemaxdots canonicalizepermittedcnames
+    casignaturealgorithms certificatefile challengeresponseauthentication channeltimeout checkhostip
+    ciphers clearallforwardings compression connectionattempts connecttimeout controlmaster
+    controlpath controlpersist dynamicforward enableescapecommandline enablesshkeysign escapechar
+    exitonforwardfailure fingerprinthash forkafterauthentication forwardagent forwardx11
+    forwardx11timeout forwardx11trusted gatewayports globalknownhostsfile gssapiauthentication
+    gssapidelegatecredentials hashknownhosts host hostbasedacceptedalgorithms hostbasedauthentication
+    hostkeyalgorithms hostkeyalias hostname identitiesonly identityagent identityfile ignoreunknown
+    include ipqos kbdinteractiveauthentication kbdinteractivedevices kexalgorithms knownhostscommand
+    localcommand localforward loglevel logverbose macs match nohostauthenticationforlocalhost
+    numberofpasswordprompts obscurekeystroketiming passwordauthentication permitlocalcommand
+    permitremoteopen pkcs11provider port preferredauthentications proxycommand proxyjump
+    proxyusefdpass pubkeyacceptedalgorithms pubkeyacceptedkeytypes pubkeyauthentication rekeylimit
+    remotecommand remoteforward requesttty requiredrsasize revokedhostkeys securitykeyprovider
+    sendenv serveralivecountmax serveraliveinterval sessiontype setenv stdinnull streamlocalbindmask
+    streamlocalbindunlink stricthostkeychecking syslogfacility tag tcpkeepalive tunnel tunneldevice
+    updatehostkeys user userknownhostsfile verifyhostkeydns visualhostkey xauthlocation
+'''.split())
+
+# Options that accumulate across lines and matching sections instead of keeping the first value
+MULTI_VALUE_OPTIONS = frozenset({
+    'certificatefile',
+    'dynamicforward',
+    'identityfile',
+    'localforward',
+    'remoteforward',
+    'sendenv',
+    'setenv',
+})
+
+# Spellings seen in configs mapped to the interned lowercase keyword, and the
+# shared option-key tuples of Host records; both are capped so that odd input
+# cannot grow them without bound
+_keyword_table = {keyword: keyword for keyword in OPENSSH_KEYWORDS}
+_key_tuples = {}
+INTERN_TABLE_MAX = 4096
+
+# Comment and blank lines, then a Host or Match line
+_BLOCK_LEAD = r'(?:[^\S\n]*(?:#[^\n]*)?\n)*(?=[^\S\n]*(?:[Hh][Oo][Ss][Tt]|[Mm][Aa][Tt][Cc][Hh])(?:[\s=]|$))'
+# A directive line followed by the comment and blank lines above a Host or Match line (group 1);
+# each such group starts a new block, so a host's comments stay with it
+BLOCK_START_RE = re.compile(r'^[^\S\n]*[^#\s][^\n]*\n(' + _BLOCK_LEAD + ')', re.MULTILINE)
+# Comments at the top of the file before its first Host or Match line, which stay a block of their own
+LEADING_BLOCK_RE = re.compile(_BLOCK_LEAD)
+
+# An option key a request may set: one keyword token, as written in ssh_config(5)
+OPTION_KEY_RE = re.compile(r'[A-Za-z][A-Za-z0-9]*')
+
+def split_directive(line):
+    """Split a config line into (keyword, value), or None for blank and comment lines"""
+    stripped = line.strip()
+    if not stripped or stripped[0] == '#':
+        return None
+    parts = stripped.split(None, 1)
+    keyword = parts[0]
+    value = parts[1] if len(parts) > 1 else ''
+    if '=' in keyword:
+        # Keyword=value, as accepted by OpenSSH
+        keyword, _, value = stripped.partition('=')
+        keyword = keyword.strip()
+        value = value.strip()
+    elif value.startswith('='):
+        value = value[1:].lstrip()
+    if not keyword:
+        return None
+    return keyword, value
+
+def intern_keyword(keyword):
+    """Return the shared lowercase string for a config keyword"""
+    interned = _keyword_table.get(keyword)
+    if interned is None:
+        interned = sys.intern(keyword.lower())
+        if interned in OPENSSH_KEYWORDS and len(_keyword_table) < INTERN_TABLE_MAX:
+            _keyword_table[keyword] = interned
+    return interned
+
+class Host:
+    """A parsed Host block: its alias patterns and its options
+
+    Options are kept in first-seen order with the last value winning, as
+    parallel tuples of interned lowercase keywords and values; hosts with the
+    same keywords in the same order share one key tuple. to_dict() gives the
+    {'name', 'options'} form the API uses.
+    """
+    __slots__ = ('name', 'keys', 'values')
+    
+    def __init__(self, name, options):
+        """options maps keywords returned by intern_keyword to their values"""
+        keys = tuple(options)
+        shared = _key_tuples.get(keys)
+        if shared is None:
+            shared = keys
+            if len(_key_tuples) < INTERN_TABLE_MAX:
+                _key_tuples[keys] = keys
+        self.name = name
+        self.keys = shared
+        self.values = tuple(options.values())
+    
+    @property
+    def options(self):
+        return dict(zip(self.keys, self.values))
+    
+    def get(self, keyword, default=None):
+        """Return the value of a lowercase keyword, or default"""
+        try:
+            return self.values[self.keys.index(keyword)]
+        except ValueError:
+            return default
+    
+    def to_dict(self):
+        return {'name': self.name, 'options': dict(zip(self.keys, self.values))}
+    
+    def __eq__(self, other):
+        if not isinstance(other, Host):
+            return NotImplemented
+        return self.name == other.name and self.keys == other.keys and self.values == other.values
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        return f"Host({self.name!r}, {list(zip(self.keys, self.values))!r})"
+
+def parse_block(text):
+    """Parse one block of config text into a node
+
+    A node records the block kind ('host', 'match', or 'global' for text
+    before the first Host/Match line), its header value and the offset of
+    the header line (comments may come before it), and every directive as
+    (start, end, keyword, value) with offsets relative to the block and the
+    keyword interned. Host blocks also carry their Host record.
+    """
+    kind = 'global'
+    header = None
+    header_offset = None
+    directives = []
+    offset = 0
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if stripped and stripped[0] != '#':
+            parts = stripped.split(None, 1)
+            if len(parts) == 2 and '=' not in parts[0] and parts[1][0] != '=':
+                keyword, value = parts
+            else:
+                directive = split_directive(stripped)
+                if directive is None:
+                    offset += len(line) + 1
+                    continue
+                keyword, value = directive
+            lower = intern_keyword(keyword)
+            if kind == 'global' and not directives and lower in ('host', 'match'):
+                kind = lower
+                header = value
+                header_offset = offset
+            else:
+                start = offset + line.find(stripped)
+                directives.append((start, start + len(stripped), lower, value))
+        offset += len(line) + 1
+    
+    host = None
+    if kind == 'host':
+        options = {}
+        for _, _, keyword, value in directives:
+            options[keyword] = value
+        host = Host(header, options)
+    return {'kind': kind, 'header': header, 'header_offset': header_offset, 'directives': directives, 'host': host}
+
+def split_config_blocks(content):
+    """Split config text on Host and Match lines; the first block holds anything before them
+
+    The comment and blank lines right above a Host or Match line open its
+    block rather than closing the previous one, so they move and are deleted
+    with the host they describe.
+    """
+    starts = [0]
+    leading = LEADING_BLOCK_RE.match(content)
+    if leading is not None and leading.end() > 0:
+        starts.append(leading.end())
+    starts.extend(m.start(1) for m in BLOCK_START_RE.finditer(content))
+    starts.append(len(content))
+    return [content[starts[i]:starts[i + 1]] for i in range(len(starts) - 1)]
+
+def parse_ssh_config(content):
+    """Parse SSH config file into a list of Host records"""
+    hosts = []
+    for text in split_config_blocks(content):
+        host = parse_block(text)['host']
+        if host is not None:
+            hosts.append(host)
+    return hosts
+
+def iter_hosts(lines):
+    """Yield the Host records of a config from an iterable of lines, such as an open file
+
+    Only the host being read is held in memory. The hosts are the same as
+    parse_ssh_config gives for the joined text.
+    """
+    name = None
+    options = {}
+    for line in lines:
+        directive = split_directive(line)
+        if directive is None:
+            continue
+        keyword, value = directive
+        lower = intern_keyword(keyword)
+        if lower in ('host', 'match'):
+            if name is not None:
+                yield Host(name, options)
+            name = value if lower == 'host' else None
+            options = {}
+        elif name is not None:
+            options[lower] = value
+    if name is not None:
+        yield Host(name, options)
+
+def parse_ssh_config_incremental(content, previous=None):
+    """Parse SSH config, re-parsing only the blocks that changed since `previous`
+
+    Returns (parsed, diff). `parsed` holds the host list plus the per-block
+    state to pass back in as `previous` next time: the block texts in order,
+    their start offsets, the parsed node of each distinct block text and the
+    block index of every host. Nodes of unchanged blocks are shared with the
+    previous result and must not be mutated. `diff` lists the host aliases
+    that were added, removed or modified.
+    """
+    old_blocks = previous['blocks'] if previous else {}
+    blocks = {}
+    hosts = []
+    host_blocks = []
+    offsets = []
+    changed = []
+    texts = split_config_blocks(content)
+    offset = 0
+    
+    for i, text in enumerate(texts):
+        node = blocks.get(text)
+        if node is None:
+            node = old_blocks.get(text)
+            if node is None:
+                node = parse_block(text)
+                if node['host'] is not None:
+                    changed.append(node['host'])
+            blocks[text] = node
+        if node['host'] is not None:
+            hosts.append(node['host'])
+            host_blocks.append(i)
+        offsets.append(offset)
+        offset += len(text)
+    
+    removed_hosts = [node['host'] for text, node in old_blocks.items() if node['host'] is not None and text not in blocks]
+    parsed = {'blocks': blocks, 'texts': texts, 'offsets': offsets, 'hosts': hosts, 'host_blocks': host_blocks}
+    return parsed, diff_host_blocks(previous['hosts'] if previous else [], hosts, changed, removed_hosts)
+
+def serialize_config(parsed):
+    """Return the config text for a parse result; unedited blocks are copied as they were read"""
+    return ''.join(parsed['texts'])
+
+def diff_host_blocks(old_hosts, new_hosts, changed, removed):
+    """Classify changed/removed Host records into added, removed and modified aliases"""
+    old_names = {host.name for host in old_hosts}
+    new_names = {host.name for host in new_hosts}
+    old_by_name = {host.name: host for host in removed}
+    
+    diff = {'added': [], 'removed': [], 'modified': []}
+    for host in changed:
+        name = host.name
+        if name not in old_names:
+            diff['added'].append(name)
+        elif old_by_name.get(name) != host:
+            diff['modified'].append(name)
+    for name in old_by_name:
+        if name not in new_names:
+            diff['removed'].append(name)
+    return diff
+
+def generate_ssh_config(hosts):
+    """Convert host list to SSH config format"""
+    lines = []
+    for host in hosts:
+        lines.append(f"Host {host['name']}")
+        for key, value in host['options'].items():
+            lines.append(f"    {key} {value}")
+        lines.append("")
+    return '\n'.join(lines)
+
+def detect_eol(texts):
+    """Return the line ending used by the first line of a block list"""
+    for text in texts:
+        i = text.find('\n')
+        if i >= 0:
+            return '\r\n' if i > 0 and text[i - 1] == '\r' else '\n'
+    return '\n'
+
+def _generate_block(host, eol):
+    text = generate_ssh_config([host])
+    return text.replace('\n', eol) if eol != '\n' else text
+
+def _drop_lines(text, directives):
+    """Remove the lines of the given directives, in block order, from a block's text"""
+    pieces = []
+    last = 0
+    for start, end, _, _ in directives:
+        line_start = text.rfind('\n', 0, start) + 1
+        line_end = text.find('\n', end)
+        pieces.append(text[last:line_start])
+        last = len(text) if line_end < 0 else line_end + 1
+    pieces.append(text[last:])
+    return ''.join(pieces)
+
+def set_block_option(text, key, value):
+    """Set an option in a Host block's text, rewriting only the value that changes
+
+    ssh uses the first value it reads for an option, so the first line
+    setting it is edited in place and any later lines for it are dropped.
+    Options that accumulate (MULTI_VALUE_OPTIONS) have their last line
+    edited and the others kept. A missing option is added after the
+    block's last directive using the same indentation.
+    """
+    node = parse_block(text)
+    lower = key.lower()
+    matches = [d for d in node['directives'] if d[2] == lower]
+    if matches:
+        if lower in MULTI_VALUE_OPTIONS:
+            start, end, _, old_value = matches[-1]
+        else:
+            start, end, _, old_value = matches[0]
+            # The duplicates all follow the edited line, so its offsets stay valid
+            text = _drop_lines(text, matches[1:])
+        if old_value:
+            return text[:end - len(old_value)] + value + text[end:]
+        return text[:end] + ' ' + value + text[end:]
+    
+    eol = detect_eol([text])
+    if node['directives']:
+        start, end = node['directives'][-1][:2]
+        indent = text[text.rfind('\n', 0, start) + 1:start]
+    else:
+        # Right after the Host line
+        end = node['header_offset'] or 0
+        indent = '    '
+    line_end = text.find('\n', end)
+    if line_end < 0:
+        return text + eol + f"{indent}{key} {value}{eol}"
+    return text[:line_end + 1] + f"{indent}{key} {value}{eol}" + text[line_end + 1:]
+
+def delete_block_option(text, key):
+    """Remove every line setting key from a Host block's text"""
+    lower = key.lower()
+    return _drop_lines(text, [d for d in parse_block(text)['directives'] if d[2] == lower])
+
+def _patch_position(op, names, allow_end=False):
+    """Resolve an op's 'index' (or first host matching 'name') to a host position"""
+    if 'index' in op:
+        pos = op['index']
+        limit = len(names) + 1 if allow_end else len(names)
+        if not isinstance(pos, int) or isinstance(pos, bool) or not 0 <= pos < limit:
+            raise ValueError(f"{op['op']}: index out of range")
+        return pos
+    if 'name' in op and not allow_end:
+        for pos, name in enumerate(names):
+            if name == op['name']:
+                return pos
+        raise ValueError(f"{op['op']}: no host named {op['name']!r}")
+    if allow_end:
+        return len(names)
+    raise ValueError(f"{op['op']}: index or name is required")
+
+def _patch_text(kind, field, value):
+    """Validate a required single-line string (numbers are accepted for values)"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"{kind}: {field} is required")
+    if '\n' in value or '\r' in value:
+        raise ValueError(f"{kind}: {field} must be a single line")
+    return value.strip()
+
+def _patch_key(kind, key):
+    """Validate an option keyword; Host and Match would start a new block, so they are refused"""
+    key = _patch_text(kind, 'key', key)
+    if not OPTION_KEY_RE.fullmatch(key):
+        raise ValueError(f"{kind}: key must be a single keyword of letters and digits, not {key!r}")
+    if key.lower() in ('host', 'match'):
+        raise ValueError(f"{kind}: {key} cannot be set as an option")
+    return key
+
+def _check_host_shape(kind, host):
+    if not isinstance(host, dict) or not isinstance(host.get('options') or {}, dict):
+        raise ValueError(f"{kind}: hosts need a name and an options object")
+
+def _checked_host(kind, host, old=None):
+    """Validate a {'name', 'options'} host from a request
+
+    A name or option equal to that of old, the Host record the host
+    replaces, is taken as it is, so what the file already has (a bare Host
+    line, a directive without a value) can be saved back unchanged.
+    """
+    _check_host_shape(kind, host)
+    options = {}
+    for key, value in (host.get('options') or {}).items():
+        if old is not None and isinstance(key, str) and key.lower() in old.keys and old.get(key.lower()) == value:
+            options[key] = value
+        else:
+            options[_patch_key(kind, key)] = _patch_text(kind, 'value', value)
+    name = host.get('name')
+    if old is None or name != old.name:
+        name = _patch_text(kind, 'name', name)
+    return {'name': name, 'options': options}
+
+def validate_hosts(hosts, kind='save'):
+    """Validate a batch of request hosts; returns the valid ones and (position, error) for the rest"""
+    valid = []
+    errors = []
+    for i, host in enumerate(hosts):
+        try:
+            valid.append(_checked_host(kind, host))
+        except ValueError as e:
+            errors.append((i, str(e)))
+    return valid, errors
+
+def _join_blocks(texts):
+    # Blocks moved away from the end of the file may lack a trailing newline
+    eol = detect_eol(texts)
+    for i in range(len(texts) - 1):
+        if texts[i] and not texts[i].endswith('\n'):
+            texts[i] += eol
+    return ''.join(texts)
+
+def apply_config_patch(parsed, ops):
+    """Apply patch ops to a parsed config and return the new file content
+
+    Ops are applied in order, and positions refer to the host list as left
+    by the previous op. Unchanged blocks are copied through as-is; only the
+    blocks an op touches are re-serialized. Global and Match blocks are
+    never moved.
+    """
+    texts = list(parsed['texts'])
+    names = [host.name for host in parsed['hosts']]
+    host_blocks = list(parsed['host_blocks'])
+    eol = detect_eol(texts)
+    
+    def insert_block(pos, text):
+        if pos < len(host_blocks):
+            block = host_blocks[pos]
+        else:
+            block = host_blocks[-1] + 1 if host_blocks else len(texts)
+        texts.insert(block, text)
+        host_blocks.insert(pos, block)
+        for j in range(pos + 1, len(host_blocks)):
+            host_blocks[j] += 1
+    
+    def remove_block(pos):
+        text = texts.pop(host_blocks.pop(pos))
+        for j in range(pos, len(host_blocks)):
+            host_blocks[j] -= 1
+        return text
+    
+    for op in ops:
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind == 'add_host':
+            host = _checked_host(kind, op)
+            pos = _patch_position(op, names, allow_end=True)
+            names.insert(pos, host['name'])
+            insert_block(pos, _generate_block(host, eol))
+        elif kind == 'delete_host':
+            pos = _patch_position(op, names)
+            del names[pos]
+            remove_block(pos)
+        elif kind == 'set_option':
+            pos = _patch_position(op, names)
+            key = _patch_key(kind, op.get('key'))
+            value = _patch_text(kind, 'value', op.get('value'))
+            block = host_blocks[pos]
+            texts[block] = set_block_option(texts[block], key, value)
+        elif kind == 'delete_option':
+            pos = _patch_position(op, names)
+            key = _patch_key(kind, op.get('key'))
+            block = host_blocks[pos]
+            texts[block] = delete_block_option(texts[block], key)
+        elif kind == 'move_host':
+            pos = _patch_position(op, names)
+            to = op.get('to')
+            if not isinstance(to, int) or isinstance(to, bool) or not 0 <= to < len(names):
+                raise ValueError('move_host: to out of range')
+            names.insert(to, names.pop(pos))
+            insert_block(to, remove_block(pos))
+        else:
+            raise ValueError(f"Unknown op: {kind!r}")
+    
+    return _join_blocks(texts)
+
+def _options_key(options):
+    return tuple(sorted((str(key).lower(), str(value)) for key, value in options.items()))
+
+def merge_ssh_config(parsed, hosts):
+    """Rebuild config text for an edited host list, keeping everything that did not change
+
+    Hosts identical to an existing block reuse its text verbatim, hosts whose
+    alias still exists only get their changed options rewritten, and the rest
+    are generated. Global options, comments and Match blocks stay after the
+    host they followed.
+    """
+    for host in hosts:
+        _check_host_shape('save', host)
+    texts = parsed['texts']
+    blocks = parsed['blocks']
+    eol = detect_eol(texts)
+    exact = {}
+    by_name = {}
+    for b in parsed['host_blocks']:
+        host = blocks[texts[b]]['host']
+        exact.setdefault((host.name, _options_key(host.options)), []).append(b)
+        by_name.setdefault(host.name, []).append(b)
+    
+    used = set()
+    origins = [None] * len(hosts)
+    out_texts = [None] * len(hosts)
+    for i, host in enumerate(hosts):
+        name = host.get('name')
+        if not isinstance(name, str):
+            continue
+        for b in exact.get((name, _options_key(host.get('options') or {})), ()):
+            if b not in used:
+                used.add(b)
+                origins[i] = b
+                out_texts[i] = texts[b]
+                break
+    for i, host in enumerate(hosts):
+        if out_texts[i] is not None:
+            continue
+        # Hosts that are not unchanged copies are validated, except for what their block already has
+        name = host.get('name')
+        for b in by_name.get(name.strip(), ()) if isinstance(name, str) else ():
+            if b not in used:
+                used.add(b)
+                origins[i] = b
+                text = texts[b]
+                old_host = blocks[text]['host']
+                old = old_host.options
+                new = {key.lower(): (key, value) for key, value in _checked_host('save', host, old_host)['options'].items()}
+                for key in old:
+                    if key not in new:
+                        text = delete_block_option(text, key)
+                for lower, (key, value) in new.items():
+                    if old.get(lower) != value:
+                        text = set_block_option(text, key, value)
+                out_texts[i] = text
+                break
+        else:
+            out_texts[i] = _generate_block(_checked_host('save', host), eol)
+    
+    # Non-host blocks follow the nearest surviving host that preceded them
+    leading = []
+    trailing = {}
+    anchor = None
+    for b, text in enumerate(texts):
+        if blocks[text]['host'] is not None:
+            if b in used:
+                anchor = b
+        elif anchor is None:
+            leading.append(text)
+        else:
+            trailing.setdefault(anchor, []).append(text)
+    
+    result = leading
+    for i, text in enumerate(out_texts):
+        result.append(text)
+        result.extend(trailing.get(origins[i], ()))
+    return _join_blocks(result)
+
+def upsert_ssh_config(parsed, hosts, replace=False):
+    """Add or update validated hosts by alias and return (content, counts)
+
+    A host whose alias names an existing Host block updates the first such
+    block in place: the options given are set and the others kept, or with
+    replace the block is regenerated with exactly those options. New aliases
+    are appended after the last Host block in input order, and a repeated
+    alias updates the block its first occurrence produced. counts tells how
+    many hosts were added, updated or left unchanged.
+    """
+    texts = list(parsed['texts'])
+    blocks = parsed['blocks']
+    eol = detect_eol(texts)
+    existing = {}
+    for b in parsed['host_blocks']:
+        existing.setdefault(blocks[texts[b]]['host'].name, b)
+    
+    added = []
+    added_by_name = {}
+    counts = {'added': 0, 'updated': 0, 'unchanged': 0}
+    for host in hosts:
+        name = host['name']
+        if name in existing:
+            target, index = texts, existing[name]
+        elif name in added_by_name:
+            target, index = added, added_by_name[name]
+        else:
+            added_by_name[name] = len(added)
+            added.append(_generate_block(host, eol))
+            counts['added'] += 1
+            continue
+        
+        old = target[index]
+        node = blocks.get(old) or parse_block(old)
+        if replace:
+            same = _options_key(node['host'].options) == _options_key(host['options'])
+            new = old if same else _generate_block(host, eol)
+        else:
+            new = old
+            for key, value in host['options'].items():
+                if node['host'].get(key.lower()) != value:
+                    new = set_block_option(new, key, value)
+        target[index] = new
+        counts['updated' if new != old else 'unchanged'] += 1
+    
+    if added:
+        end = parsed['host_blocks'][-1] + 1 if parsed['host_blocks'] else len(texts)
+        texts[end:end] = added
+    return _join_blocks(texts), counts
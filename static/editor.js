@@ -0,0 +1,433 @@
+// The page's ?tenant= selects whose config every API call works on
+const TENANT = new URLSearchParams(location.search).get('tenant');
+
+function api(url, options = {}) {
+    if (TENANT) options.headers = Object.assign({}, options.headers, {'X-SSH-Config-Tenant': TENANT});
+    return fetch(url, options);
+}
+
+// hosts is indexed by position in the file and stays sparse until every page is fetched;
+// slots maps rows of the (possibly filtered) list to host positions
+let hosts = [];
+let draggedIndex = null;
+let slots = [];
+let slotTotal = 0;
+let searchQuery = '';
+let searchTimer = null;
+let allLoaded = false;
+let listVersion = null;
+let pendingOps = [];
+let rawVersion = null;
+let listGeneration = 0;
+let pageRequests = {};
+let renderedRange = null;
+let renderPending = false;
+let saving = false;
+let events = null;
+const cardHeights = {};
+const PAGE_SIZE = 200;
+const ESTIMATED_CARD_HEIGHT = 170;
+const OVERSCAN_PX = 600;
+
+function loadConfig() {
+    hosts = [];
+    allLoaded = false;
+    listVersion = null;
+    pendingOps = [];
+    resetList();
+    fetchPage(0).then(() => {
+        showMessage('Configuration loaded', 'success');
+        watchConfig();
+    }).catch(err => showMessage('Load failed: ' + err, 'error'));
+}
+
+function watchConfig() {
+    // Changes saved elsewhere arrive as host deltas; without EventSource, Refresh still works
+    if (events || typeof EventSource === 'undefined') return;
+    const params = new URLSearchParams({version: listVersion});
+    if (TENANT) params.set('tenant', TENANT);
+    events = new EventSource('/api/events?' + params);
+    events.addEventListener('config', e => applyConfigEvent(JSON.parse(e.data)));
+    events.onerror = () => { if (events.readyState === EventSource.CLOSED) events = null; };
+}
+
+function applyConfigEvent(change) {
+    // A reload or our own save already has this version
+    if (listVersion === null || change.version === listVersion || saving) return;
+    if (pendingOps.length) {
+        showMessage('Configuration was changed elsewhere, refresh before saving', 'error');
+        return;
+    }
+    if (change.reload || change.previous !== listVersion) {
+        showMessage('Configuration changed on disk, reloading', 'error');
+        loadConfig();
+        return;
+    }
+    // Removed positions refer to the list before the change, added and modified ones to the list after it
+    hosts.length = Math.max(hosts.length, change.total - change.added.length + change.removed.length);
+    for (let i = change.removed.length - 1; i >= 0; i--) hosts.splice(change.removed[i].index, 1);
+    change.added.forEach(added => hosts.splice(added.index, 0, added.host));
+    change.modified.forEach(modified => { hosts[modified.index] = modified.host; });
+    hosts.length = change.total;
+    listVersion = change.version;
+    listGeneration++;
+    pageRequests = {};
+    if (allLoaded || !searchQuery) {
+        if (allLoaded) rebuildLocalSlots();
+        else {
+            slots = Array.from({length: change.total}, (_, i) => i);
+            slotTotal = change.total;
+        }
+        renderHosts(true);
+    } else {
+        resetList();
+        fetchPage(0).catch(err => showMessage('Load failed: ' + err, 'error'));
+    }
+}
+
+function resetList() {
+    listGeneration++;
+    slots = [];
+    slotTotal = 0;
+    pageRequests = {};
+    renderedRange = null;
+    document.getElementById('hostsList').scrollTop = 0;
+}
+
+function fetchPage(offset) {
+    const page = Math.floor(offset / PAGE_SIZE) * PAGE_SIZE;
+    if (pageRequests[page]) return pageRequests[page];
+    const generation = listGeneration;
+    const query = encodeURIComponent(searchQuery);
+    pageRequests[page] = api(`/api/hosts?offset=${page}&limit=${PAGE_SIZE}&q=${query}`).then(r => r.json()).then(data => {
+        if (data.error) throw data.error;
+        if (generation !== listGeneration) return;
+        if (listVersion !== null && data.version !== listVersion) {
+            showMessage('Configuration changed on disk, reloading', 'error');
+            loadConfig();
+            return;
+        }
+        listVersion = data.version;
+        slotTotal = data.total;
+        data.hosts.forEach((host, i) => {
+            if (!(host.index in hosts)) hosts[host.index] = {name: host.name, options: host.options};
+            slots[page + i] = host.index;
+        });
+        renderHosts(true);
+    }).catch(err => {
+        delete pageRequests[page];
+        throw err;
+    });
+    return pageRequests[page];
+}
+
+function loadAllHosts() {
+    // Structural edits shift positions, so fetch the rest of the file before making one
+    if (allLoaded) return Promise.resolve();
+    return api('/api/config').then(r => {
+        if (listVersion !== null && r.headers.get('ETag') !== `"${listVersion}"`) {
+            throw 'configuration changed on disk, please refresh';
+        }
+        return r.json();
+    }).then(data => {
+        if (data.error) throw data.error;
+        data.hosts.forEach((host, idx) => { if (!(idx in hosts)) hosts[idx] = host; });
+        hosts.length = data.hosts.length;
+        allLoaded = true;
+        listGeneration++;
+        rebuildLocalSlots();
+    });
+}
+
+function hostMatches(host, query) {
+    const terms = host.name.toLowerCase().split(/\s+/);
+    Object.entries(host.options).forEach(([key, value]) => {
+        const lower = key.toLowerCase();
+        if (lower === 'hostname' || lower === 'user') terms.push(String(value).toLowerCase());
+    });
+    return terms.some(term => query.length < 3 ? term.startsWith(query) : term.includes(query));
+}
+
+function rebuildLocalSlots() {
+    const query = searchQuery.toLowerCase();
+    slots = [];
+    hosts.forEach((host, idx) => { if (!query || hostMatches(host, query)) slots.push(idx); });
+    slotTotal = slots.length;
+}
+
+function onSearchInput() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => {
+        searchQuery = document.getElementById('hostSearch').value.trim();
+        resetList();
+        if (allLoaded) {
+            rebuildLocalSlots();
+            renderHosts(true);
+        } else {
+            fetchPage(0).catch(err => showMessage('Search failed: ' + err, 'error'));
+        }
+    }, 200);
+}
+
+function slotHeight(slot) {
+    const idx = slots[slot];
+    return (idx !== undefined && cardHeights[idx]) || ESTIMATED_CARD_HEIGHT;
+}
+
+function scheduleRender() {
+    if (renderPending) return;
+    renderPending = true;
+    requestAnimationFrame(() => { renderPending = false; renderHosts(false); });
+}
+
+function renderHosts(force) {
+    const listEl = document.getElementById('hostsList');
+    if (slotTotal === 0) {
+        const text = searchQuery ? 'No matching hosts' : 'No hosts configured yet';
+        listEl.innerHTML = `<p style="color: #a0aec0; text-align: center; padding: 40px;">${text}</p>`;
+        renderedRange = null;
+        return;
+    }
+
+    // Only the cards around the viewport are in the DOM; spacers stand in for the rest
+    const top = listEl.scrollTop - OVERSCAN_PX;
+    const bottom = listEl.scrollTop + listEl.clientHeight + OVERSCAN_PX;
+    let start = 0, before = 0;
+    while (start < slotTotal - 1 && before + slotHeight(start) < top) { before += slotHeight(start); start++; }
+    let end = start, y = before;
+    while (end < slotTotal && y < bottom) { y += slotHeight(end); end++; }
+    if (!force && renderedRange && renderedRange[0] === start && renderedRange[1] === end) return;
+    renderedRange = [start, end];
+    let after = 0;
+    for (let i = end; i < slotTotal; i++) after += slotHeight(i);
+
+    const cards = [];
+    for (let slot = start; slot < end; slot++) {
+        const idx = slots[slot];
+        if (idx === undefined || !(idx in hosts)) {
+            cards.push('<div class="host-placeholder">Loading...</div>');
+            if (!allLoaded) fetchPage(slot).catch(err => showMessage('Load failed: ' + err, 'error'));
+        } else {
+            cards.push(renderHostCard(hosts[idx], idx));
+        }
+    }
+    listEl.innerHTML = `<div style="height: ${before}px"></div>${cards.join('')}<div style="height: ${after}px"></div>`;
+    listEl.querySelectorAll('.host-card').forEach(card => { cardHeights[card.dataset.index] = card.offsetHeight + 12; });
+}
+
+function renderHostCard(host, idx) {
+    const optionsHtml = Object.entries(host.options).map(([key, value]) => `
+        <div class="option-row">
+            <input type="text" value="${key}" disabled style="background: #fafafa;">
+            <input type="text" value="${value}" onchange="updateOption(${idx}, '${key}', this.value)">
+            <button class="btn-danger btn-small" onclick="deleteOption(${idx}, '${key}')">Delete</button>
+        </div>
+    `).join('');
+
+    return `
+        <div class="host-card" draggable="true" data-index="${idx}" ondragstart="dragStart(event)" ondragend="dragEnd(event)" ondragover="dragOver(event)" ondrop="drop(event)">
+            <div class="host-name">
+                <span><span class="drag-handle">⋮⋮</span>${host.name}</span>
+                <button class="btn-danger btn-small" onclick="deleteHost(${idx})">Delete</button>
+            </div>
+            <div class="host-options">${optionsHtml}</div>
+            <div class="add-option-section">
+                <select id="optionSelect_${idx}" onchange="onOptionSelectChange(${idx})">
+                    <option value="">Add...</option>
+                    <option value="HostName">HostName</option>
+                    <option value="User">User</option>
+                    <option value="Port">Port</option>
+                    <option value="IdentityFile">IdentityFile</option>
+                    <option value="ProxyCommand">ProxyCommand</option>
+                    <option value="ProxyJump">ProxyJump</option>
+                    <option value="LocalForward">LocalForward</option>
+                    <option value="RemoteForward">RemoteForward</option>
+                    <option value="custom">Custom...</option>
+                </select>
+                <input type="text" id="optionValue_${idx}" placeholder="Enter value" onkeypress="if(event.key==='Enter') addOption(${idx})"></input>
+                <button class="btn-success btn-small" onclick="addOption(${idx})">Add</button>
+            </div>
+        </div>
+    `;
+}
+
+function updateOption(idx, key, value) {
+    hosts[idx].options[key] = value;
+    pendingOps.push({op: 'set_option', index: idx, key, value});
+}
+function deleteHost(idx) {
+    if (!confirm('Are you sure you want to delete?')) return;
+    loadAllHosts().then(() => {
+        hosts.splice(idx, 1);
+        pendingOps.push({op: 'delete_host', index: idx});
+        rebuildLocalSlots();
+        renderHosts(true);
+    }).catch(err => showMessage('Load failed: ' + err, 'error'));
+}
+function deleteOption(idx, key) {
+    delete hosts[idx].options[key];
+    pendingOps.push({op: 'delete_option', index: idx, key});
+    renderHosts(true);
+}
+
+function onOptionSelectChange(idx) {
+    const selectEl = document.getElementById(`optionSelect_${idx}`);
+    if (selectEl.value === 'custom') {
+        const customKey = prompt('Enter custom option name:');
+        if (customKey) {
+            selectEl.value = customKey;
+            document.getElementById(`optionValue_${idx}`).focus();
+        } else {
+            selectEl.value = '';
+        }
+    }
+}
+
+function addOption(idx) {
+    const selectEl = document.getElementById(`optionSelect_${idx}`);
+    const valueEl = document.getElementById(`optionValue_${idx}`);
+    let key = selectEl.value;
+    const value = valueEl.value.trim();
+
+    if (!key || !value) {
+        showMessage('Please select an option and enter a value', 'error');
+        return;
+    }
+
+    hosts[idx].options[key] = value;
+    pendingOps.push({op: 'set_option', index: idx, key, value});
+    selectEl.value = '';
+    valueEl.value = '';
+    renderHosts(true);
+    showMessage('Option added', 'success');
+}
+
+function showAddHostModal() { document.getElementById('addHostModal').classList.add('active'); }
+function closeAddHostModal() {
+    document.getElementById('addHostModal').classList.remove('active');
+    document.getElementById('newHostName').value = '';
+    document.getElementById('newHostHostname').value = '';
+    document.getElementById('newHostUser').value = '';
+    document.getElementById('newHostPort').value = '';
+    document.getElementById('newHostIdentity').value = '';
+}
+
+function addHost() {
+    const name = document.getElementById('newHostName').value.trim();
+    if (!name) { showMessage('Please enter a host name', 'error'); return; }
+
+    const options = {};
+    const hostname = document.getElementById('newHostHostname').value.trim();
+    const user = document.getElementById('newHostUser').value.trim();
+    const port = document.getElementById('newHostPort').value.trim();
+    const identity = document.getElementById('newHostIdentity').value.trim();
+
+    if (hostname) options.HostName = hostname;
+    if (user) options.User = user;
+    if (port) options.Port = port;
+    if (identity) options.IdentityFile = identity;
+
+    closeAddHostModal();
+    loadAllHosts().then(() => {
+        hosts.push({name, options});
+        pendingOps.push({op: 'add_host', name, options});
+        rebuildLocalSlots();
+        renderHosts(true);
+        showMessage('Host added', 'success');
+    }).catch(err => showMessage('Load failed: ' + err, 'error'));
+}
+
+function saveConfig() {
+    // Only the edits made since the last save are sent, checked against the version they were made on
+    if (pendingOps.length === 0) { showMessage('No changes to save', 'success'); return; }
+    const ops = pendingOps.slice();
+    saving = true;
+    api('/api/config', {
+        method: 'PATCH',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({version: listVersion, ops})
+    }).then(r => r.json()).then(data => {
+        if (data.success) {
+            pendingOps.splice(0, ops.length);
+            listVersion = data.version;
+            showMessage('Configuration saved', 'success');
+        }
+        else showMessage('Save failed: ' + data.error, 'error');
+    }).catch(err => showMessage('Save failed: ' + err, 'error')).finally(() => { saving = false; });
+}
+
+function showMessage(text, type) {
+    const msg = document.getElementById('message');
+    msg.textContent = text;
+    msg.className = 'message show ' + type;
+    setTimeout(() => msg.classList.remove('show'), 3000);
+}
+
+function switchTab(e, tab) {
+    e.preventDefault();
+    document.querySelectorAll('.tab-content').forEach(el => el.classList.remove('active'));
+    document.getElementById(tab + '-content').classList.add('active');
+    document.querySelectorAll('.tab-button').forEach(btn => btn.classList.remove('active'));
+    e.target.classList.add('active');
+    if (tab === 'raw') loadRawConfig();
+    else renderHosts(true);
+}
+
+function loadRawConfig() {
+    api('/api/raw-config').then(r => r.json()).then(data => {
+        if (data.error) throw data.error;
+        rawVersion = data.version;
+        document.getElementById('rawEditor').value = data.config;
+    }).catch(err => showMessage('Load failed: ' + err, 'error'));
+}
+
+function saveRawConfig() {
+    const content = document.getElementById('rawEditor').value;
+    api('/api/save-raw', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({content, version: rawVersion})
+    }).then(r => r.json()).then(data => {
+        if (data.success) { showMessage('Saved', 'success'); loadConfig(); }
+        else showMessage('Save failed: ' + data.error, 'error');
+    }).catch(err => showMessage('Save failed: ' + err, 'error'));
+}
+
+function dragStart(event) {
+    draggedIndex = parseInt(event.target.closest('.host-card').dataset.index);
+    event.target.closest('.host-card').classList.add('dragging');
+}
+
+function dragEnd(event) {
+    document.querySelectorAll('.host-card').forEach(card => {
+        card.classList.remove('dragging');
+        card.classList.remove('drag-over');
+    });
+}
+
+function dragOver(event) {
+    event.preventDefault();
+    const card = event.target.closest('.host-card');
+    if (card && draggedIndex !== null) card.classList.add('drag-over');
+}
+
+function drop(event) {
+    event.preventDefault();
+    const card = event.target.closest('.host-card');
+    if (!card) return;
+    const dragIndex = draggedIndex;
+    const dropIndex = parseInt(card.dataset.index);
+    if (dragIndex !== null && dragIndex !== dropIndex) {
+        loadAllHosts().then(() => {
+            const draggedHost = hosts.splice(dragIndex, 1)[0];
+            const newIndex = dragIndex < dropIndex ? dropIndex - 1 : dropIndex;
+            hosts.splice(newIndex, 0, draggedHost);
+            pendingOps.push({op: 'move_host', index: dragIndex, to: newIndex});
+            rebuildLocalSlots();
+            renderHosts(true);
+        }).catch(err => showMessage('Load failed: ' + err, 'error'));
+    }
+    document.querySelectorAll('.host-card').forEach(c => c.classList.remove('drag-over'));
+}
+
+loadConfig();
@@ -0,0 +1,480 @@
+"""Per-tenant config store: parse cache, coalescing writer and memory-bounded eviction
+
+A tenant is one user's ssh config. The default tenant is the config of the
+user running the app; named tenants map to paths through
+SSH_CONFIG_PATH_TEMPLATE (e.g. "~{tenant}/.ssh/config"). Each tenant has
+its own cache entry keyed on the file's (inode, mtime_ns, size), its own
+lock for read-modify-write cycles and its own write batch. Parsed entries
+are kept in LRU order and dropped, least recently used first, when the
+estimated memory of all entries exceeds the budget or there are too many of
+them; the next request for that tenant re-reads the file.
+
+When several worker processes serve the same configs, read-modify-write
+cycles are also serialized across processes with an flock on a lock file
+next to the config (the config itself is replaced on every save, so it
+cannot carry the lock). Under gevent that lock is polled, and the write and
+post-write hooks run in gevent's threadpool, so a save waiting on another
+process or on the disk does not stall the worker's other greenlets.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import hashlib
+import os
+import platform
+import re
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: there is no multi-process server there, so the thread locks suffice
+    fcntl = None
+
+from includes import forget_config, wake_watcher
+from metrics import count_cache, count_read, observe_stage, timed
+from sshconfig import CONFIG_ENCODING, parse_ssh_config_incremental
+
+# Windows and Unix path compatibility
+if platform.system() == 'Windows':
+    DEFAULT_CONFIG_PATH = os.path.expanduser("~\\.ssh\\config")
+else:
+    DEFAULT_CONFIG_PATH = os.path.expanduser("~/.ssh/config")
+
+# Path of a named tenant's config, with {tenant} replaced by its name; unset serves only the default tenant
+TENANT_PATH_TEMPLATE = os.environ.get('SSH_CONFIG_PATH_TEMPLATE')
+TENANT_NAME_RE = re.compile(r'[A-Za-z0-9_][A-Za-z0-9_.-]{0,63}')
+
+# Bounds on the parsed entries kept in memory across tenants
+CACHE_MAX_TENANTS = int(os.environ.get('SSH_CONFIG_CACHE_TENANTS', '256'))
+CACHE_MEMORY_BUDGET = int(float(os.environ.get('SSH_CONFIG_CACHE_MB', '512')) * 1024 * 1024)
+# A parsed entry with its search index takes roughly this many times the file size
+ENTRY_SIZE_FACTOR = 20
+ENTRY_SIZE_MIN = 16 * 1024
+
+# Saves queued within this many seconds of each other share one disk write
+WRITE_COALESCE_WINDOW = float(os.environ.get('SSH_CONFIG_WRITE_WINDOW', '0'))
+
+# Seconds between tries for a file lock another process holds, under gevent
+FILE_LOCK_POLL_INTERVAL = 0.01
+
+_tenants = {}
+# Tenants with a parsed entry in memory, least recently used first, with its estimated size
+_lru = OrderedDict()
+_tenants_lock = threading.Lock()
+_cache_metrics = {'evictions': 0}
+
+# Called as hook(tenant, entry, previous) before a save is queued; see add_pre_save_hook()
+_pre_save_hooks = []
+# Called as hook(tenant, entry, previous, source) once a save is on disk; see add_post_write_hook()
+_post_write_hooks = []
+
+# Guards every tenant's write batch and the writer counters
+_writer_cond = threading.Condition()
+_writer_metrics = {
+    'saves': 0,
+    'coalesced_saves': 0,
+    'writes': 0,
+    'write_errors': 0,
+    'post_write_errors': 0,
+    'bytes_written': 0,
+    'write_seconds_total': 0.0,
+    'write_seconds_max': 0.0,
+    'write_seconds_last': 0.0,
+}
+
+def tenant_path(name):
+    """Return the config path of a tenant; raises LookupError for names that cannot be served"""
+    if not name:
+        return DEFAULT_CONFIG_PATH
+    if not TENANT_PATH_TEMPLATE:
+        raise LookupError('Tenants are not enabled (set SSH_CONFIG_PATH_TEMPLATE)')
+    if not TENANT_NAME_RE.fullmatch(name):
+        raise LookupError(f'Invalid tenant name: {name!r}')
+    path = os.path.expanduser(TENANT_PATH_TEMPLATE.replace('{tenant}', name))
+    # Only tenants whose .ssh directory exists, so arbitrary names cannot pile up state
+    if not os.path.isdir(os.path.dirname(path)):
+        raise LookupError(f'Unknown tenant: {name!r}')
+    return path
+
+def get_tenant(name=''):
+    """Return the state of a tenant, creating it on first use, and mark it recently used"""
+    with _tenants_lock:
+        tenant = _tenants.get(name)
+        if name in _lru:
+            _lru.move_to_end(name)
+    if tenant is not None:
+        return tenant
+    
+    tenant = {
+        'name': name,
+        'path': tenant_path(name),
+        'entry': None,
+        'cache_lock': threading.Lock(),
+        # Held while fill_config_cache() loads the config in the background
+        'fill_lock': threading.Lock(),
+        # Serializes read-modify-write cycles on the config file
+        'write_lock': threading.Lock(),
+        'io_lock': threading.Lock(),
+        'writer': {'batch': None, 'latest': None},
+        # The cross-process file lock, held while a transaction is open or a batch awaits writing
+        'file_lock': {'fd': None, 'users': 0, 'mutex': threading.Lock()},
+    }
+    with _tenants_lock:
+        return _tenants.setdefault(name, tenant)
+
+def _account(tenant, entry):
+    """Record a newly installed entry's size, then drop least recently used entries over the limits"""
+    size = max((entry['key'] or (0, 0, 0))[2] * ENTRY_SIZE_FACTOR, ENTRY_SIZE_MIN)
+    victims = []
+    with _tenants_lock:
+        _lru[tenant['name']] = size
+        _lru.move_to_end(tenant['name'])
+        total = sum(_lru.values())
+        for name in list(_lru):
+            if total <= CACHE_MEMORY_BUDGET and len(_lru) <= CACHE_MAX_TENANTS:
+                break
+            victim = _tenants[name]
+            # Never drop the entry just installed or one with a save still in flight
+            if victim is tenant or victim['writer']['latest'] is not None:
+                continue
+            total -= _lru.pop(name)
+            victim['entry'] = None
+            victims.append(victim)
+        _cache_metrics['evictions'] += len(victims)
+    for victim in victims:
+        forget_config(victim['path'])
+
+def config_stat_key(tenant):
+    """Return the (inode, mtime_ns, size) cache key of a tenant's config, or None if it is missing"""
+    try:
+        st = os.stat(tenant['path'])
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def build_config_entry(content, key, mtime, previous=None):
+    """Parse content into a cache entry, reusing unchanged blocks from the previous entry"""
+    with timed('parse'):
+        parsed, diff = parse_ssh_config_incremental(content, previous['parsed'] if previous else None)
+    hosts = parsed['hosts']
+    # The JSON body is built by the first request that needs it, not on every save
+    return {
+        'key': key,
+        'parsed': parsed,
+        'diff': diff,
+        'hosts': hosts,
+        'etag': hashlib.sha1(content.encode('utf-8', 'surrogateescape')).hexdigest(),
+        'last_modified': datetime.fromtimestamp(mtime, timezone.utc) if mtime is not None else None,
+    }
+
+def peek_config_cache(tenant):
+    """Return the tenant's cache entry if it is current, without reading the file"""
+    entry = tenant['entry']
+    if entry is not None and entry['key'] == config_stat_key(tenant):
+        count_cache(True)
+        return entry
+    return None
+
+def load_config_cached(tenant):
+    """Return the cached parse of a tenant's config, re-parsing only when the file changed"""
+    key = config_stat_key(tenant)
+    
+    with tenant['cache_lock']:
+        entry = tenant['entry']
+        if entry is not None and entry['key'] == key:
+            count_cache(True)
+            return entry
+        count_cache(False)
+        
+        content = ""
+        mtime = None
+        if key is not None:
+            with open(tenant['path'], 'r', **CONFIG_ENCODING) as f:
+                # Key on the descriptor we actually read so a concurrent write
+                # shows up as a stale key on the next request
+                st = os.fstat(f.fileno())
+                key = (st.st_ino, st.st_mtime_ns, st.st_size)
+                mtime = st.st_mtime
+                with timed('read'):
+                    content = f.read()
+                count_read(st.st_size)
+        
+        entry = build_config_entry(content, key, mtime, entry)
+        tenant['entry'] = entry
+    _account(tenant, entry)
+    return entry
+
+def fill_config_cache(tenant):
+    """Load a tenant's config into the cache in a background thread, unless a fill is already running
+
+    For responses served without the cache, such as a large config streamed
+    from disk, so that the next request is answered from memory.
+    """
+    if not tenant['fill_lock'].acquire(blocking=False):
+        return
+    
+    def fill():
+        try:
+            load_config_cached(tenant)
+        except Exception:
+            pass
+        finally:
+            tenant['fill_lock'].release()
+    
+    threading.Thread(target=fill, name='ssh-config-cache-fill', daemon=True).start()
+
+def _cooperative():
+    """True when gevent has patched the standard library, so a call that blocks stalls every greenlet"""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+def _off_loop(func, *args):
+    """Call func, in gevent's threadpool when gevent is in use
+
+    fsync() and SQLite commits block in the kernel; run on the event loop
+    they would stall every greenlet of the worker, open event streams
+    included.
+    """
+    if _cooperative():
+        from gevent import get_hub
+        return get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+def match_owner(fd, path, mode=None):
+    """Give the open file fd the owner and group of path, or of its directory when path does not exist yet
+
+    mode, if given, is applied too; None copies path's mode when it exists.
+    A server running as root thus leaves a tenant's files owned by the
+    tenant. Does nothing on Windows.
+    """
+    if platform.system() == 'Windows':
+        return
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        st = os.stat(os.path.dirname(path))
+    else:
+        if mode is None:
+            mode = stat.S_IMODE(st.st_mode)
+    current = os.fstat(fd)
+    if (current.st_uid, current.st_gid) != (st.st_uid, st.st_gid):
+        os.fchown(fd, st.st_uid, st.st_gid)
+    if mode is not None and stat.S_IMODE(current.st_mode) != mode:
+        os.fchmod(fd, mode)
+
+def lock_path(path):
+    """Lock file that serializes writers of a config across processes"""
+    return os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.lock')
+
+def _hold_file_lock(tenant):
+    file_lock = tenant['file_lock']
+    with file_lock['mutex']:
+        if file_lock['users'] == 0 and fcntl is not None:
+            os.makedirs(os.path.dirname(tenant['path']), exist_ok=True)
+            fd = os.open(lock_path(tenant['path']), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                match_owner(fd, tenant['path'], 0o600)
+                if _cooperative():
+                    # Poll so that other greenlets keep running while another process holds the lock
+                    while True:
+                        try:
+                            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                            break
+                        except BlockingIOError:
+                            time.sleep(FILE_LOCK_POLL_INTERVAL)
+                else:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+            file_lock['fd'] = fd
+        file_lock['users'] += 1
+
+def _release_file_lock(tenant):
+    file_lock = tenant['file_lock']
+    with file_lock['mutex']:
+        file_lock['users'] -= 1
+        if file_lock['users'] == 0 and file_lock['fd'] is not None:
+            # Closing the descriptor drops the flock
+            os.close(file_lock['fd'])
+            file_lock['fd'] = None
+
+@contextmanager
+def config_transaction(tenant):
+    """Serialize a read-modify-write of a tenant's config across threads and worker processes
+
+    Reads inside the block see every save made by other processes, and a
+    save queued inside keeps the file locked until it is on disk, so no
+    other process can write in between.
+    """
+    with tenant['write_lock']:
+        _hold_file_lock(tenant)
+        try:
+            yield
+        finally:
+            _release_file_lock(tenant)
+
+def atomic_write(path, content):
+    """Write content to a temp file, fsync it and rename it over path
+
+    Readers such as ssh see either the old or the new file, never a partial one.
+    A symlinked config (say, into a dotfiles repository) is written through:
+    the link's target is replaced and the link left in place. The new file
+    keeps the owner, group and mode of the one it replaces.
+    """
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', **CONFIG_ENCODING) as f:
+            # Keep the config's owner and mode; a new config gets its directory's owner and mode 600
+            match_owner(f.fileno(), path)
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    
+    if platform.system() != 'Windows':
+        # Persist the rename itself
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def current_config_entry(tenant):
+    """Return the tenant's newest config state, including saves still waiting to be written"""
+    with _writer_cond:
+        latest = tenant['writer']['latest']
+    return latest if latest is not None else load_config_cached(tenant)
+
+def add_pre_save_hook(hook):
+    """Register hook(tenant, entry, previous) to vet each save's parsed entry; raising ValueError rejects the save"""
+    _pre_save_hooks.append(hook)
+
+def add_post_write_hook(hook):
+    """Register hook(tenant, entry, previous, source) to run after each batch is written
+
+    previous is the entry the batch's first save was based on, and source
+    the label the last save was queued with. Hooks run while the config is
+    still locked, so they see writes in order (under gevent, in its
+    threadpool); their errors are counted but do not fail the save.
+    """
+    _post_write_hooks.append(hook)
+
+def queue_config_write(tenant, content, previous, source='save'):
+    """Parse content as the tenant's new config state and add it to its current write batch
+
+    Call inside config_transaction(), then call finish_config_write() after
+    leaving it so that other saves can join the batch. source labels the
+    save for post-write hooks, such as 'save', 'import' or 'rollback:<id>'.
+    """
+    entry = build_config_entry(content, None, None, previous)
+    for hook in _pre_save_hooks:
+        hook(tenant, entry, previous)
+    writer = tenant['writer']
+    with _writer_cond:
+        batch = writer['batch']
+        leader = batch is None
+        if leader:
+            batch = writer['batch'] = {'done': threading.Event(), 'error': None, 'previous': previous}
+            _hold_file_lock(tenant)
+        else:
+            _writer_metrics['coalesced_saves'] += 1
+        batch['content'] = content
+        batch['entry'] = entry
+        batch['source'] = source
+        writer['latest'] = entry
+        _writer_metrics['saves'] += 1
+    return {'tenant': tenant, 'batch': batch, 'leader': leader, 'entry': entry}
+
+def finish_config_write(ticket):
+    """Write the batch if this save started it, otherwise wait for it; returns the saved entry
+
+    Only the last content queued in a batch reaches the disk, and the cache
+    is updated from it without reading the file back.
+    """
+    tenant = ticket['tenant']
+    batch = ticket['batch']
+    if not ticket['leader']:
+        batch['done'].wait()
+    else:
+        if WRITE_COALESCE_WINDOW > 0:
+            time.sleep(WRITE_COALESCE_WINDOW)
+        with tenant['io_lock']:
+            # Saves that arrived while an earlier batch was being written join this one too
+            with _writer_cond:
+                tenant['writer']['batch'] = None
+            started = time.monotonic()
+            entry = None
+            try:
+                _off_loop(atomic_write, tenant['path'], batch['content'])
+                st = os.stat(tenant['path'])
+                entry = dict(batch['entry'], key=(st.st_ino, st.st_mtime_ns, st.st_size),
+                             last_modified=datetime.fromtimestamp(st.st_mtime, timezone.utc))
+                with tenant['cache_lock']:
+                    tenant['entry'] = entry
+            except Exception as e:
+                batch['error'] = e
+            elapsed = time.monotonic() - started
+            if batch['error'] is None:
+                observe_stage('write', elapsed)
+            with _writer_cond:
+                if tenant['writer']['latest'] is batch['entry']:
+                    tenant['writer']['latest'] = None
+                if batch['error'] is None:
+                    _writer_metrics['writes'] += 1
+                    _writer_metrics['bytes_written'] += len(batch['content'].encode('utf-8', 'surrogateescape'))
+                else:
+                    _writer_metrics['write_errors'] += 1
+                _writer_metrics['write_seconds_total'] += elapsed
+                _writer_metrics['write_seconds_last'] = elapsed
+                _writer_metrics['write_seconds_max'] = max(_writer_metrics['write_seconds_max'], elapsed)
+            if entry is not None:
+                for hook in _post_write_hooks:
+                    try:
+                        _off_loop(hook, tenant, entry, batch['previous'], batch['source'])
+                    except Exception:
+                        with _writer_cond:
+                            _writer_metrics['post_write_errors'] += 1
+            _release_file_lock(tenant)
+            if entry is not None:
+                _account(tenant, entry)
+                # Watch listeners hear about the save without waiting for the next poll
+                wake_watcher()
+        batch['done'].set()
+    
+    if batch['error'] is not None:
+        raise batch['error']
+    return ticket['entry']
+
+def get_writer_metrics():
+    """Snapshot of the writer's save, coalescing and latency counters"""
+    with _writer_cond:
+        metrics = dict(_writer_metrics)
+    metrics['write_seconds_avg'] = metrics['write_seconds_total'] / metrics['writes'] if metrics['writes'] else 0.0
+    metrics['coalesce_window'] = WRITE_COALESCE_WINDOW
+    return metrics
+
+def get_cache_metrics():
+    """Snapshot of the tenant cache: entries and estimated bytes held, and evictions"""
+    with _tenants_lock:
+        metrics = dict(_cache_metrics)
+        metrics['tenants'] = len(_tenants)
+        metrics['cached_tenants'] = len(_lru)
+        metrics['cached_bytes_estimate'] = sum(_lru.values())
+    metrics['memory_budget'] = CACHE_MEMORY_BUDGET
+    metrics['max_tenants'] = CACHE_MAX_TENANTS
+    return metrics
\ No newline at end of file